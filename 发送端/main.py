@@ -1,18 +1,31 @@
-import tkinter as tk
-from tkinter import messagebox
 import psutil
 import socket
+import select
+import queue
+import time
+import bisect
 import json
 from datetime import datetime
 import threading
 import configparser
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+import argparse
+import signal
 from collections import deque
-import matplotlib.pyplot as plt
 import platform
+import subprocess
+import shutil
 import sys
-from matplotlib import font_manager
+import os
+import hashlib
+
+# GUI和绘图模块在创建窗口时才导入（见load_gui_modules），无界面模式下始终不加载
+tk = None
+messagebox = None
+Figure = None
+FigureCanvasTkAgg = None
+plt = None
+font_manager = None
+tk_font = None
 
 
 def get_system_fonts():
@@ -26,6 +39,63 @@ def get_system_fonts():
     return sorted(fonts)
 
 
+def get_font_cache_path():
+    """字体缓存文件路径，三个程序共用同一份缓存"""
+    if platform.system() == 'Windows':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    elif platform.system() == 'Darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'perfmon', 'font_cache.json')
+
+
+def get_font_dirs_signature():
+    """系统字体目录（含子目录）修改时间的摘要，安装或删除字体后随之变化，用于判断缓存是否失效"""
+    font_dirs = list(getattr(font_manager, 'X11FontDirectories', []))
+    font_dirs += getattr(font_manager, 'OSXFontDirectories', [])
+    font_dirs += getattr(font_manager, 'MSUserFontDirectories', [])
+    if platform.system() == 'Windows':
+        font_dirs.append(font_manager.win32FontDirectory())
+
+    digest = hashlib.sha1()
+    for font_dir in sorted(set(font_dirs)):
+        if not os.path.isdir(font_dir):
+            continue
+        for path, subdirs, _ in os.walk(font_dir):
+            subdirs.sort()
+            try:
+                digest.update(f"{path}:{os.stat(path).st_mtime_ns}\n".encode('utf-8', errors='replace'))
+            except OSError:
+                pass
+    return digest.hexdigest()
+
+
+def load_font_cache():
+    """读取字体缓存，文件不存在或损坏时返回空字典"""
+    try:
+        with open(get_font_cache_path(), encoding='utf-8') as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_font_cache(key, signature, font):
+    """写入字体缓存（先写临时文件再替换，避免多个程序同时启动时读到半个文件）"""
+    path = get_font_cache_path()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        cache = load_font_cache()
+        cache[key] = {'signature': signature, 'font': font}
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"写入字体缓存失败: {e}")
+
+
 def find_chinese_font():
     """寻找可用的中文字体"""
     # 根据系统设置候选字体列表
@@ -50,61 +120,465 @@ def find_chinese_font():
     # 添加通用字体
     candidates += ['sans-serif', 'Arial', 'Helvetica']
 
-    # 查找系统中实际存在的字体
+    # 字体目录未变化时直接使用磁盘缓存的结果，避免每次启动都扫描全部字体
+    cache_key = '|'.join(candidates)
+    signature = get_font_dirs_signature()
+    cached = load_font_cache().get(cache_key)
+    if isinstance(cached, dict) and cached.get('signature') == signature:
+        return cached['font']
+
+    # 查找系统中实际存在的字体；如果都没有，使用第一个备选字体
     system_fonts = get_system_fonts()
+    chosen = candidates[0] if candidates else 'sans-serif'
     for font in candidates:
         if font in system_fonts:
-            return font
+            chosen = font
+            break
+
+    save_font_cache(cache_key, signature, chosen)
+    return chosen
+
+
+def load_gui_modules():
+    """导入Tkinter和matplotlib并设置中文字体，只在创建窗口时执行一次"""
+    global tk, messagebox, Figure, FigureCanvasTkAgg, plt, font_manager, tk_font
+    if tk is not None:
+        return
+    import tkinter as tk
+    from tkinter import messagebox
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    import matplotlib.pyplot as plt
+    from matplotlib import font_manager
+
+    # 设置matplotlib支持中文显示
+    chosen_font = find_chinese_font()
+    plt.rcParams['font.sans-serif'] = [chosen_font]
+    plt.rcParams['axes.unicode_minus'] = False
+
+    # 设置Tkinter字体
+    if platform.system() == 'Windows':
+        tk_font = ('Microsoft YaHei', 10)
+    elif platform.system() == 'Darwin':  # macOS
+        tk_font = ('PingFang SC', 10)
+    else:  # Linux
+        tk_font = ('WenQuanYi Micro Hei', 10)
 
-    # 如果都没有，返回第一个备选字体
-    return candidates[0] if candidates else 'sans-serif'
+    print(f"Using font: {chosen_font} for matplotlib")
+    print(f"Using Tkinter font: {tk_font}")
 
+# GPU监控优先使用NVML（可选依赖pynvml），否则使用常驻的nvidia-smi查询循环（见GpuMonitor）
+try:
+    import pynvml
+except ImportError:
+    pynvml = None
+
+
+class ConnectionManager:
+    """到单个目标（接收端或日志服务器）的长连接管理器
+
+    所有待发送数据先进入有界队列，由唯一的发送线程写入同一条TCP连接；
+    连接失败或断开后按指数退避重连，期间数据保留在队列中，队列满时丢弃最旧的数据。
+    连接保持stable_after秒以上后断开才从backoff_min重新退避；建立后很快被对端关闭
+    （如接收端连接数已满）按失败处理，退避时间继续加倍。
+    """
+    def __init__(self, ip, port, timeout=2, max_queue=1000, backoff_min=0.5, backoff_max=30, stable_after=5):
+        self.address = (ip, port)
+        self.timeout = timeout
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.stable_after = stable_after
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._sock = None
+        self._backoff = backoff_min
+        self._next_attempt = 0.0
+        self._connected_at = 0.0
+        # 发送统计：最近一条数据从入队到写出的延迟、写入失败和连接失败次数、队列满丢弃的条数
+        self.latency_ms = None
+        self.send_failures = 0
+        self.connect_failures = 0
+        self.dropped = 0
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"conn-{ip}:{port}", daemon=True)
+        self._thread.start()
+
+    def send(self, data):
+        """非阻塞入队，由发送线程异步写出"""
+        self._put((time.monotonic(), data))
+
+    def close(self, timeout=None):
+        """通知发送线程退出；timeout不为空时最多等待timeout秒，让队列中剩余数据写出"""
+        if timeout is not None:
+            self._put(None)
+            self._thread.join(timeout)
+        self._stop_event.set()
+        self._put(None)  # 唤醒发送线程
+
+    def stats(self):
+        """发送统计，供发送端上报自身开销"""
+        return {
+            'latency_ms': round(self.latency_ms, 3) if self.latency_ms is not None else None,
+            'failures': self.send_failures,
+            'connect_failures': self.connect_failures,
+            'dropped': self.dropped,
+            'queue': self._queue.qsize(),
+            'spool_bytes': 0
+        }
 
-# 设置matplotlib支持中文显示
-chosen_font = find_chinese_font()
-plt.rcParams['font.sans-serif'] = [chosen_font]
-plt.rcParams['axes.unicode_minus'] = False
+    def _put(self, item):
+        """入队，队列满时丢弃最旧的一条"""
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            item = self._queue.get()
+            if item is None:
+                break
+            queued_at, data = item
+            # 同一条数据重试直到发送成功或程序退出
+            while not self._stop_event.is_set():
+                if self._sock is not None and self._peer_closed():
+                    self._disconnect()
+                if self._sock is None and not self._connect():
+                    continue
+                try:
+                    self._sock.sendall(data)
+                    self.latency_ms = (time.monotonic() - queued_at) * 1000
+                    break
+                except OSError as e:
+                    print(f"连接错误 ({self.address[0]}:{self.address[1]}): {str(e)}")
+                    self.send_failures += 1
+                    self._disconnect()
+        self._disconnect()
+
+    def _connect(self):
+        """等待退避时间后建立连接，成功返回True"""
+        delay = self._next_attempt - time.monotonic()
+        if delay > 0 and self._stop_event.wait(delay):
+            return False
+        try:
+            sock = socket.create_connection(self.address, timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        except OSError as e:
+            print(f"连接错误 ({self.address[0]}:{self.address[1]}): {str(e)}")
+            self.connect_failures += 1
+            self._next_attempt = time.monotonic() + self._backoff
+            self._backoff = min(self._backoff * 2, self.backoff_max)
+            return False
+        self._sock = sock
+        self._connected_at = time.monotonic()
+        return True
+
+    def _peer_closed(self):
+        """对端从不回写数据，连接变为可读即表示已被关闭或复位"""
+        try:
+            readable, _, _ = select.select([self._sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
 
-# 设置Tkinter字体
-if platform.system() == 'Windows':
-    tk_font = ('Microsoft YaHei', 10)
-elif platform.system() == 'Darwin':  # macOS
-    tk_font = ('PingFang SC', 10)
-else:  # Linux
-    tk_font = ('WenQuanYi Micro Hei', 10)
+    def _disconnect(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+            now = time.monotonic()
+            if now - self._connected_at >= self.stable_after:
+                self._backoff = self.backoff_min
+            self._next_attempt = now + self._backoff
+            self._backoff = min(self._backoff * 2, self.backoff_max)
+
+
+class GpuMonitor:
+    """GPU采集线程
+
+    按refresh周期在后台刷新所有GPU的使用率、显存和温度，采样时只读取缓存的最新值。
+    优先使用NVML（pynvml）；不可用时启动一个常驻的nvidia-smi查询循环（--loop-ms），
+    逐行读取其输出，不再每次采样都创建nvidia-smi子进程。smi_path可指向测试用的假脚本。
+    """
+    QUERY = 'index,name,utilization.gpu,memory.used,memory.total,temperature.gpu'
+
+    def __init__(self, refresh=1.0, smi_path='nvidia-smi'):
+        self.refresh = refresh
+        self.smi_path = smi_path
+        self.backend = None  # 'nvml'、'nvidia-smi'，或None（没有可用的GPU）
+        self._gpus = {}      # index -> GPU信息
+        self._updated = 0.0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._process = None
+        self._thread = None
+
+    def start(self):
+        """探测可用的后端并启动采集线程，返回是否有可用的GPU"""
+        if pynvml is not None:
+            try:
+                pynvml.nvmlInit()
+                self.backend = 'nvml'
+            except Exception as e:
+                print(f"NVML初始化失败: {str(e)}")
+        if self.backend is None and shutil.which(self.smi_path):
+            self.backend = 'nvidia-smi'
+        if self.backend is None:
+            return False
+        target = self._run_nvml if self.backend == 'nvml' else self._run_smi
+        self._thread = threading.Thread(target=target, name="gpu", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop_event.set()
+        if self._process is not None:
+            self._process.terminate()
+
+    def latest(self):
+        """最新的GPU列表；超过3个刷新周期没有更新（采集卡住或退出）时返回空列表"""
+        with self._lock:
+            if time.monotonic() - self._updated > self.refresh * 3:
+                return []
+            return [dict(self._gpus[index]) for index in sorted(self._gpus)]
+
+    def _publish(self, gpu):
+        with self._lock:
+            self._gpus[gpu['index']] = gpu
+            self._updated = time.monotonic()
+
+    def _run_nvml(self):
+        while not self._stop_event.is_set():
+            try:
+                for index in range(pynvml.nvmlDeviceGetCount()):
+                    handle = pynvml.nvmlDeviceGetHandleByIndex(index)
+                    name = pynvml.nvmlDeviceGetName(handle)
+                    memory = pynvml.nvmlDeviceGetMemoryInfo(handle)
+                    self._publish({
+                        'index': index,
+                        'name': name.decode() if isinstance(name, bytes) else name,
+                        'load': float(pynvml.nvmlDeviceGetUtilizationRates(handle).gpu),
+                        'mem_used': memory.used / 1024 / 1024,  # MB
+                        'mem_total': memory.total / 1024 / 1024,
+                        'temp': float(pynvml.nvmlDeviceGetTemperature(handle, pynvml.NVML_TEMPERATURE_GPU))
+                    })
+            except Exception as e:
+                print(f"获取GPU数据失败: {str(e)}")
+            self._stop_event.wait(self.refresh)
 
-print(f"Using font: {chosen_font} for matplotlib")
-print(f"Using Tkinter font: {tk_font}")
+    def _run_smi(self):
+        """nvidia-smi每个周期为每块GPU输出一行；进程意外退出时等待一个周期后重启"""
+        command = [
+            self.smi_path, f'--query-gpu={self.QUERY}',
+            '--format=csv,noheader,nounits', f'--loop-ms={int(self.refresh * 1000)}'
+        ]
+        while not self._stop_event.is_set():
+            try:
+                self._process = subprocess.Popen(
+                    command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, bufsize=1
+                )
+                for line in self._process.stdout:
+                    gpu = self.parse_smi_line(line)
+                    if gpu is not None:
+                        self._publish(gpu)
+                self._process.wait()
+            except OSError as e:
+                print(f"启动nvidia-smi失败: {str(e)}")
+            self._stop_event.wait(self.refresh)
+
+    @staticmethod
+    def parse_smi_line(line):
+        """解析一行CSV输出，无法解析时返回None；[N/A]等非数值字段记为None"""
+        fields = [field.strip() for field in line.split(',')]
+        if len(fields) != 6:
+            return None
+
+        def number(value):
+            try:
+                return float(value)
+            except ValueError:
+                return None
 
-# GPU支持检测
-try:
-    import GPUtil
+        try:
+            index = int(fields[0])
+        except ValueError:
+            return None
+        return {
+            'index': index,
+            'name': fields[1],
+            'load': number(fields[2]),
+            'mem_used': number(fields[3]),
+            'mem_total': number(fields[4]),
+            'temp': number(fields[5])
+        }
 
-    GPU_ENABLED = True
-except ImportError:
-    GPU_ENABLED = False
 
+class LatencyHistogram:
+    """固定分桶的耗时直方图（毫秒），计数自程序启动起累计，接收端可自行做差得到区间分布"""
+    BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)  # 各桶上界，最后一个桶为超过1000ms
 
-class PerformanceMonitor:
     def __init__(self):
-        # 初始化主窗口
-        self.root = tk.Tk()
-        self.root.title("服务器性能监视软件发送端")
-        self.root.geometry("1024x768")
-        self.root.attributes('-alpha', 0.85)
-        self.root.configure(bg='#1a1a1a')
+        self.counts = [0] * (len(self.BOUNDS_MS) + 1)
+        self.total = 0.0
+        self.max = 0.0
 
+    def record(self, value_ms):
+        self.counts[bisect.bisect_left(self.BOUNDS_MS, value_ms)] += 1
+        self.total += value_ms
+        self.max = max(self.max, value_ms)
 
-        if platform.system() == 'Windows':
-            self.root.iconbitmap('send.ico')
+    def snapshot(self):
+        count = sum(self.counts)
+        return {
+            'counts': list(self.counts),
+            'avg': round(self.total / count, 3) if count else 0.0,
+            'max': round(self.max, 3)
+        }
+
+
+class PeriodicScheduler:
+    """基于单调时钟的周期调度
+
+    以绝对的周期时刻为目标，任务耗时不会累积成漂移；第一个周期时刻对齐到墙上时钟的整周期，
+    使时钟同步的各主机在同一时刻采样。错过周期时按策略处理：skip跳到下一个未来的周期时刻，
+    catchup立即连续补执行（最多补max_catchup个，更早的直接跳过）。
+    """
+    def __init__(self, interval, policy='skip', max_catchup=5):
+        self.interval = interval
+        self.policy = policy
+        self.max_catchup = max_catchup
+        self.next_deadline = None
+        self.ticks = 0
+        self.missed = 0
+        self.jitter = LatencyHistogram()   # 实际开始时刻与目标时刻之差
+        self.latency = LatencyHistogram()  # 每次采集耗时
+
+    def wait_time(self):
+        """距离下一个目标时刻的秒数"""
+        if self.next_deadline is None:
+            offset = self.interval - (time.time() % self.interval)
+            self.next_deadline = time.monotonic() + offset
+        return max(0.0, self.next_deadline - time.monotonic())
+
+    def begin(self):
+        """任务开始：记录调度抖动，返回(开始时间, 抖动毫秒数)"""
+        now = time.monotonic()
+        jitter_ms = abs(now - self.next_deadline) * 1000
+        self.jitter.record(jitter_ms)
+        return now, jitter_ms
+
+    def end(self, started):
+        """任务结束：记录耗时并推进到下一个目标时刻，返回本次耗时（毫秒）"""
+        now = time.monotonic()
+        latency_ms = (now - started) * 1000
+        self.latency.record(latency_ms)
+        self.ticks += 1
+        self.next_deadline += self.interval
+        if self.next_deadline <= now:
+            behind = int((now - self.next_deadline) // self.interval) + 1
+            skipped = behind if self.policy != 'catchup' else max(0, behind - self.max_catchup)
+            self.next_deadline += skipped * self.interval
+            self.missed += skipped
+        return latency_ms
+
+    def set_interval(self, interval):
+        """修改周期：下一个目标时刻改为按新周期从上一个目标时刻推算，已过期时立即执行"""
+        if self.next_deadline is not None:
+            self.next_deadline += interval - self.interval
+        self.interval = interval
+
+    def stats(self):
+        """调度统计，随数据帧发送"""
+        return {
+            'interval_ms': round(self.interval * 1000, 3),
+            'policy': self.policy,
+            'ticks': self.ticks,
+            'missed': self.missed,
+            'bounds_ms': list(LatencyHistogram.BOUNDS_MS),
+            'jitter_ms': self.jitter.snapshot(),
+            'collect_ms': self.latency.snapshot()
+        }
+
+
+class AdaptiveSampler:
+    """自适应采样周期
+
+    指标平稳时每次把周期放大backoff倍，直到max_interval；相邻两次采样的CPU、内存、磁盘、GPU
+    变化超过change_threshold个百分点，或任一指标达到告警阈值时，立即切换到min_interval。
+    网络字段是累计字节数而非速率，不参与判断。
+    """
+
+    def __init__(self, min_interval, max_interval, change_threshold=5.0, alerts=None, backoff=2.0):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.change_threshold = change_threshold
+        self.alerts = alerts or {}  # 指标名 -> 告警阈值
+        self.backoff = backoff
+        self.interval = min_interval
+        self._last = None
+
+    def update(self, sample):
+        """根据最新样本计算下一次的采样周期（秒）"""
+        last, self._last = self._last, sample
+        alert = any(
+            sample.get(key) is not None and sample[key] >= limit
+            for key, limit in self.alerts.items()
+        )
+        if last is None or alert or self.change(last, sample) >= self.change_threshold:
+            self.interval = self.min_interval
         else:
-        # macOS/Linux 推荐使用 .png
-            try:
-                from tkinter import PhotoImage
-                icon = PhotoImage(file='send.png')
-                self.root.iconphoto(True, icon)
-            except Exception as e:
-                print(f"设置图标失败: {e}")
+            self.interval = min(self.max_interval, self.interval * self.backoff)
+        return self.interval
+
+    def change(self, last, sample):
+        """两个样本之间的最大变化幅度"""
+        change = max(abs(sample[key] - last[key]) for key in ('cpu', 'mem', 'disk'))
+        if sample['gpu'] is not None and last['gpu'] is not None:
+            change = max(change, abs(sample['gpu'] - last['gpu']))
+        return change
+
+
+class SampleBatcher:
+    """发送端的批量缓冲
+
+    样本先在本地累积，满max_samples个或距第一个样本超过max_delay_ms（先到者）时合并成一帧。
+    max_samples为1时每个样本单独成帧，与未启用批量时一致。
+    本发送端在每次采样后检查是否需要发送，按时间发送的精度为一个采样周期。
+    """
+    def __init__(self, max_samples=1, max_delay_ms=1000):
+        self.max_samples = max(1, max_samples)
+        self.max_delay = max_delay_ms / 1000
+        self._items = []
+        self._first_time = 0.0
+
+    def add(self, item):
+        if not self._items:
+            self._first_time = time.monotonic()
+        self._items.append(item)
+
+    def ready(self):
+        return bool(self._items) and (
+            len(self._items) >= self.max_samples or time.monotonic() - self._first_time >= self.max_delay
+        )
+
+    def drain(self):
+        items, self._items = self._items, []
+        return items
+
+
+class PerformanceMonitor:
+    def __init__(self, headless=False):
+        # headless为True时只采集和发送，不创建窗口，也不导入GUI和绘图模块
+        self.headless = headless
+        self.root = None
 
         # 运行状态控制
         self.running = True
@@ -113,6 +587,52 @@ class PerformanceMonitor:
         # 配置和数据结构初始化
         self.config = configparser.ConfigParser()
         self.config.read('config.ini')
+
+        # 以下功能只在托盘发送端（发送端后台服务版）中提供，本发送端不读取对应的配置项，只发送基本指标：
+        # 本发送端在界面线程中定时采样，耗时的采集会阻塞界面，托盘发送端在独立的采集线程中执行
+        #   扩展采集器：collectors（cpu_cores、disk_io、nics、partitions）
+        #   进程排行：collectors中的processes、top_processes、process_budget_ms
+        #   窗口聚合：aggregate_window（需要采集线程以高于发送间隔的频率采样）
+        #   插件采集器：collectors中的plugins、plugin_dir、plugin_timeout
+        #   差量编码：delta_encoding、keyframe_interval、delta_epsilon（本发送端始终发送完整样本，接收端两种都能处理）
+
+        # 到每个接收端和日志服务器的长连接，各自只有一个发送线程，慢的或断开的接收端不会拖慢其他接收端
+        self.receiver_conns = [ConnectionManager(ip, port) for ip, port in self.receiver_addresses()]
+        # log_via_receiver开启时只连接接收端，日志由接收端批量转发到日志服务器
+        self.log_conn = None
+        if not self.config.getboolean('sender', 'log_via_receiver', fallback=False):
+            self.log_conn = ConnectionManager(
+                self.config['sender']['log_server_ip'],
+                self.config.getint('sender', 'log_server_port')
+            )
+
+        # 每秒一次的周期调度，调度统计每隔sched_stats_interval秒随数据发送一次
+        self.scheduler = PeriodicScheduler(
+            1.0, policy=self.config.get('sender', 'schedule_policy', fallback='skip')
+        )
+        self.sched_stats_interval = self.config.getint('sender', 'sched_stats_interval', fallback=60)
+        self.sched_stats_sent = 0.0
+        self.adaptive = self.create_adaptive_sampler()
+
+        # 批量发送：满batch_size个样本或超过batch_interval毫秒时合并成一帧
+        self.batcher = SampleBatcher(
+            self.config.getint('sender', 'batch_size', fallback=1),
+            self.config.getint('sender', 'batch_interval', fallback=1000)
+        )
+
+        # 发送端自身开销的统计（随每条数据上报，见agent_stats）
+        self.agent_process = psutil.Process()
+        self.agent_process.cpu_percent(interval=None)
+        self.collect_timings = {}  # 最近一次采样中各部分的耗时（毫秒）
+        self.serialize_ms = 0.0    # 上一条数据的序列化耗时（毫秒）
+
+        # GPU在独立线程中按gpu_refresh周期采集，采样时只读取缓存值
+        self.gpu = GpuMonitor(
+            self.config.getint('sender', 'gpu_refresh', fallback=1000) / 1000,
+            self.config.get('sender', 'nvidia_smi_path', fallback='nvidia-smi')
+        )
+        self.gpu_enabled = self.gpu.start()
+
         self.history = {
             'cpu': deque(maxlen=60),
             'mem': deque(maxlen=60),
@@ -123,10 +643,66 @@ class PerformanceMonitor:
         }
 
         # 初始化界面和绑定事件
-        self.init_ui()
-        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        if not headless:
+            self.create_main_window()
+            self.init_ui()
+            self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         self.start_monitoring()
 
+    def receiver_addresses(self):
+        """接收端列表，返回[(地址, 端口)]
+
+        receivers为逗号分隔的“地址:端口”（IPv6地址写作[地址]:端口），未配置时使用receiver_ip/receiver_port。
+        """
+        receivers = self.config.get('sender', 'receivers', fallback='').strip()
+        if not receivers:
+            return [(self.config['sender']['receiver_ip'], self.config.getint('sender', 'receiver_port'))]
+        addresses = []
+        for item in receivers.split(','):
+            ip, _, port = item.strip().rpartition(':')
+            if not ip or not port.isdigit():
+                print(f"接收端地址格式错误: {item.strip()}")
+                continue
+            addresses.append((ip.strip('[]'), int(port)))
+        return addresses
+
+    def create_adaptive_sampler(self):
+        """adaptive_sampling开启时按配置创建自适应采样器，否则返回None（固定每秒采样）"""
+        if not self.config.getboolean('sender', 'adaptive_sampling', fallback=False):
+            return None
+        alerts = {}
+        for key in ('cpu', 'mem', 'disk', 'gpu'):
+            limit = self.config.getfloat('sender', f'{key}_alert', fallback=0)
+            if limit > 0:
+                alerts[key] = limit
+        return AdaptiveSampler(
+            self.config.getint('sender', 'min_interval', fallback=250) / 1000,
+            self.config.getint('sender', 'max_interval', fallback=5000) / 1000,
+            change_threshold=self.config.getfloat('sender', 'change_threshold', fallback=5),
+            alerts=alerts
+        )
+
+    def create_main_window(self):
+        """初始化主窗口"""
+        load_gui_modules()
+        self.root = tk.Tk()
+        self.root.title("服务器性能监视软件发送端")
+        self.root.geometry("1024x768")
+        self.root.attributes('-alpha', 0.85)
+        self.root.configure(bg='#1a1a1a')
+
+
+        if platform.system() == 'Windows':
+            self.root.iconbitmap('send.ico')
+        else:
+        # macOS/Linux 推荐使用 .png
+            try:
+                from tkinter import PhotoImage
+                icon = PhotoImage(file='send.png')
+                self.root.iconphoto(True, icon)
+            except Exception as e:
+                print(f"设置图标失败: {e}")
+
     def init_ui(self):
         """初始化用户界面组件"""
         # 创建图表
@@ -140,10 +716,28 @@ class PerformanceMonitor:
         self.ax.spines['left'].set_color('white')
         self.ax.xaxis.label.set_color('white')
         self.ax.yaxis.label.set_color('white')
+        self.ax.set_xlim(0, self.history['cpu'].maxlen - 1)
+        self.ax.set_ylim(0, 100)
+        self.ax.set_xlabel('时间（秒）', color='white')
+        self.ax.set_ylabel('使用率 (%)', color='white')
+        self.ax.grid(True, color='#333333', linestyle='--', alpha=0.3)
+
+        # 曲线只创建一次，之后用set_data更新；animated的曲线不参与整图重绘，由update_ui单独绘制
+        lines = [('cpu', 'CPU', 'cyan'), ('mem', '内存', 'yellow'), ('disk', '磁盘', 'magenta')]
+        if self.gpu_enabled:
+            lines.append(('gpu', 'GPU', 'red'))
+        self.lines = {}
+        for key, label, color in lines:
+            self.lines[key], = self.ax.plot([], [], label=label, color=color, alpha=0.8, animated=True)
+        self.ax.legend(facecolor='#1a1a1a', labelcolor='white', prop={'size': 9})
 
         self.canvas = FigureCanvasTkAgg(self.figure, master=self.root)
         self.canvas.get_tk_widget().pack(expand=True, fill=tk.BOTH, padx=20, pady=20)
 
+        # 整图重绘（首次显示、窗口缩放）后缓存不含曲线的背景，供blit使用
+        self.background = None
+        self.canvas.mpl_connect('draw_event', self.on_canvas_draw)
+
         # 实时数据状态栏
         self.status_frame = tk.Frame(self.root, bg='#1a1a1a')
         self.status_frame.pack(pady=10)
@@ -153,7 +747,7 @@ class PerformanceMonitor:
             ('磁盘', 'magenta'), ('上行', 'green'),
             ('下行', 'blue')
         ]
-        if GPU_ENABLED:
+        if self.gpu_enabled:
             status_labels.append(('GPU', 'red'))
 
         self.status_vars = {}
@@ -167,6 +761,8 @@ class PerformanceMonitor:
 
     def get_performance(self):
         """获取系统性能指标"""
+        started = time.perf_counter()
+
         # CPU使用率
         cpu = psutil.cpu_percent()
 
@@ -181,17 +777,18 @@ class PerformanceMonitor:
         net_up = net.bytes_sent
         net_down = net.bytes_recv
 
-        # GPU使用率（如果可用）
-        gpu_load = None
-        if GPU_ENABLED:
-            try:
-                gpus = GPUtil.getGPUs()
-                if gpus:
-                    gpu_load = gpus[0].load * 100
-            except Exception as e:
-                print(f"获取GPU数据失败: {str(e)}")
+        base_ms = (time.perf_counter() - started) * 1000
 
-        return {
+        # GPU使用率（如果可用）：gpu为第一块GPU的使用率，gpus为所有GPU的详细信息
+        started = time.perf_counter()
+        gpus = self.gpu.latest() if self.gpu_enabled else []
+        gpu_load = gpus[0]['load'] if gpus else None
+        self.collect_timings = {
+            'base': round(base_ms, 3),
+            'gpu': round((time.perf_counter() - started) * 1000, 3)
+        }
+
+        data = {
             'time': datetime.now().isoformat(),
             'cpu': cpu,
             'mem': mem,
@@ -200,42 +797,30 @@ class PerformanceMonitor:
             'net_down': net_down,
             'gpu': gpu_load
         }
+        if gpus:
+            data['gpus'] = gpus
+        return data
+
+    def on_canvas_draw(self, event):
+        """整图重绘完成：缓存坐标区背景，并把曲线画回本次重绘的结果中"""
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.draw_lines()
+
+    def draw_lines(self):
+        """用最新历史数据更新曲线并绘制到画布缓冲区"""
+        for key, line in self.lines.items():
+            values = self.history[key]
+            line.set_data(range(len(values)), values)
+            self.ax.draw_artist(line)
 
     def update_ui(self, data):
-        """更新界面显示"""
-        # 清除旧图表
-        self.ax.clear()
-
-        # 设置坐标轴颜色
-        self.ax.set_facecolor('#1a1a1a')
-        self.ax.tick_params(colors='white')
-        self.ax.spines['bottom'].set_color('white')
-        self.ax.spines['top'].set_color('white')
-        self.ax.spines['right'].set_color('white')
-        self.ax.spines['left'].set_color('white')
-        self.ax.xaxis.label.set_color('white')
-        self.ax.yaxis.label.set_color('white')
-
-        # 绘制新数据
-        lines = [
-            (self.history['cpu'], 'CPU', 'cyan'),
-            (self.history['mem'], '内存', 'yellow'),
-            (self.history['disk'], '磁盘', 'magenta')
-        ]
-        if GPU_ENABLED and self.history['gpu']:
-            lines.append((self.history['gpu'], 'GPU', 'red'))
-
-        for values, label, color in lines:
-            if values:
-                self.ax.plot(values, label=label, color=color, alpha=0.8)
-
-        # 设置图表属性
-        self.ax.set_ylim(0, 100)
-        self.ax.set_xlabel('时间（秒）', color='white')
-        self.ax.set_ylabel('使用率 (%)', color='white')
-        self.ax.legend(facecolor='#1a1a1a', labelcolor='white', prop={'size': 9})
-        self.ax.grid(True, color='#333333', linestyle='--', alpha=0.3)
-        self.canvas.draw()
+        """更新界面显示：恢复缓存的背景，只重画曲线并blit坐标区"""
+        if self.background is None:
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self.background)
+            self.draw_lines()
+        self.canvas.blit(self.ax.bbox)
 
         # 更新数值显示
         self.status_vars['CPU'].set(f"{data['cpu']:.1f}%")
@@ -248,18 +833,91 @@ class PerformanceMonitor:
         self.status_vars['上行'].set(f"{net_up}KB/s")
         self.status_vars['下行'].set(f"{net_down}KB/s")
 
-        if GPU_ENABLED:
+        if self.gpu_enabled:
             gpu_text = f"{data['gpu']:.1f}%" if data['gpu'] else "N/A"
             self.status_vars['GPU'].set(gpu_text)
 
+    def collect_and_send(self):
+        """按调度时刻采集一次性能数据放入批量缓冲，满足条件时合并发送，返回采集结果"""
+        started, jitter_ms = self.scheduler.begin()
+        try:
+            data = self.get_performance()
+        finally:
+            collect_ms = self.scheduler.end(started)
+        data['jitter_ms'] = round(jitter_ms, 3)
+        data['collect_ms'] = round(collect_ms, 3)
+        if self.adaptive is not None:
+            self.scheduler.set_interval(self.adaptive.update(data))
+
+        self.batcher.add(data)
+        if self.batcher.ready():
+            self.flush_batch()
+        return data
+
+    def flush_batch(self):
+        """将批量缓冲中的样本合并成一帧交给长连接发送；单个样本保持原有的data格式"""
+        batch = self.batcher.drain()
+        if not batch:
+            return
+        name = self.config['sender']['computer_name']
+        if len(batch) == 1:
+            payload = {'name': name, 'data': batch[0]}
+        else:
+            payload = {'name': name, 'samples': batch}
+        payload['agent'] = self.agent_stats()
+        now = time.monotonic()
+        if now - self.sched_stats_sent >= self.sched_stats_interval:
+            payload['sched'] = self.scheduler.stats()
+            self.sched_stats_sent = now
+
+        # 交给各接收端的长连接发送（每条消息以换行结尾，便于在长连接上分帧）。
+        # log_via_receiver开启时日志只由第一个接收端转发：发给它的消息带log_via_receiver标记，
+        # 接收端只转发带标记的样本的日志，发给其他接收端的消息不带标记，避免重复转发
+        started = time.perf_counter()
+        message = first = json.dumps(payload).encode() + b'\n'
+        if self.log_conn is None:
+            first = json.dumps(dict(payload, log_via_receiver=True)).encode() + b'\n'
+        self.serialize_ms = (time.perf_counter() - started) * 1000
+        for index, conn in enumerate(self.receiver_conns):
+            conn.send(first if index == 0 else message)
+
+        # 发送日志信息，同一批次的日志合并为一次写入
+        if self.log_conn is not None:
+            log_msg = ''.join(
+                f"[{data['time']}] {name} - CPU:{data['cpu']}% MEM:{data['mem']}%\n" for data in batch
+            )
+            self.log_conn.send(log_msg.encode())
+
+    def agent_stats(self):
+        """发送端自身的开销
+
+        包括进程CPU（%，可超过100）和内存、各部分采集耗时、上一条数据的序列化耗时，
+        以及到接收端和日志服务器的发送延迟、失败次数和队列积压。
+        report_interval_ms为两帧之间的最长预期间隔（当前采样周期加上批量等待时间），接收端据此判断设备是否离线。
+        """
+        with self.agent_process.oneshot():
+            cpu = self.agent_process.cpu_percent(interval=None)
+            rss = self.agent_process.memory_info().rss
+        return {
+            'cpu': round(cpu, 1),
+            'rss_mb': round(rss / 1024 / 1024, 1),
+            'report_interval_ms': round((self.scheduler.interval + self.batcher.max_delay) * 1000),
+            'collect_ms': self.collect_timings,
+            'serialize_ms': round(self.serialize_ms, 3),
+            'receivers': [
+                dict(conn.stats(), address=f'{conn.address[0]}:{conn.address[1]}') for conn in self.receiver_conns
+            ],
+            'log_server': self.log_conn.stats() if self.log_conn is not None else None
+        }
+
     def send_data(self):
         """执行监控和数据发送"""
         if not self.running:
             return
 
         try:
-            # 获取并处理性能数据
-            data = self.get_performance()
+            # 获取、发送性能数据
+            data = self.collect_and_send()
 
             # 更新历史记录
             self.history['cpu'].append(data['cpu'])
@@ -268,53 +926,36 @@ class PerformanceMonitor:
             if data['gpu'] is not None:
                 self.history['gpu'].append(data['gpu'])
 
-            # 准备发送数据
-            payload = {
-                'name': self.config['sender']['computer_name'],
-                'data': data
-            }
-
-            # 启动发送线程
-            threading.Thread(
-                target=self.send_to_server,
-                args=(
-                    self.config['sender']['receiver_ip'],
-                    self.config.getint('sender', 'receiver_port'),
-                    json.dumps(payload).encode()
-                ),
-                daemon=True
-            ).start()
-
-            # 发送日志信息
-            log_msg = f"[{data['time']}] {payload['name']} - CPU:{data['cpu']}% MEM:{data['mem']}%"
-            threading.Thread(
-                target=self.send_to_server,
-                args=(
-                    self.config['sender']['log_server_ip'],
-                    self.config.getint('sender', 'log_server_port'),
-                    log_msg.encode()
-                ),
-                daemon=True
-            ).start()
-
             # 更新界面
             self.update_ui(data)
 
         except Exception as e:
             print(f"数据采集/发送异常: {str(e)}")
 
-        # 调度下一次执行
-        self.after_id = self.root.after(1000, self.send_data)
+        # 调度到下一个周期时刻执行，扣除本次耗时，避免周期漂移
+        self.after_id = self.root.after(int(self.scheduler.wait_time() * 1000), self.send_data)
 
-    def send_to_server(self, ip, port, data):
-        """网络发送方法"""
+    def run_headless(self):
+        """无界面模式：在主线程中循环采集发送，直到收到Ctrl+C或SIGTERM"""
+        stop_event = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+        print("无界面模式运行中，按Ctrl+C退出")
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(2)
-                s.connect((ip, port))
-                s.sendall(data)
-        except Exception as e:
-            print(f"连接错误 ({ip}:{port}): {str(e)}")
+            while not stop_event.wait(self.scheduler.wait_time()):
+                try:
+                    self.collect_and_send()
+                except Exception as e:
+                    print(f"数据采集/发送异常: {str(e)}")
+        except KeyboardInterrupt:
+            pass
+        self.running = False
+        self.gpu.stop()
+        # 发出批量缓冲中剩余的样本，并等待发送线程把已入队的数据写出
+        self.flush_batch()
+        for conn in self.receiver_conns:
+            conn.close(timeout=2)
+        if self.log_conn is not None:
+            self.log_conn.close(timeout=2)
 
     def on_close(self):
         """处理关闭事件（新增确认对话框）"""
@@ -325,6 +966,12 @@ class PerformanceMonitor:
         ):
             print("正在执行退出操作...")
             self.running = False
+            self.gpu.stop()
+            self.flush_batch()
+            for conn in self.receiver_conns:
+                conn.close()
+            if self.log_conn is not None:
+                self.log_conn.close()
 
             # 取消定时任务
             if self.after_id:
@@ -336,9 +983,16 @@ class PerformanceMonitor:
 
     def start_monitoring(self):
         """启动监控循环"""
-        self.root.after(1000, self.send_data)
+        if self.headless:
+            self.run_headless()
+            return
+        self.after_id = self.root.after(int(self.scheduler.wait_time() * 1000), self.send_data)
         self.root.mainloop()
 
 
 if __name__ == "__main__":
-    monitor = PerformanceMonitor()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="服务器性能监视软件发送端")
+    parser.add_argument('--headless', action='store_true',
+                        help='无界面模式：只采集和发送，不加载GUI和绘图模块')
+    args = parser.parse_args()
+    monitor = PerformanceMonitor(headless=args.headless)
\ No newline at end of file
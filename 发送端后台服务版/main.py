@@ -1,22 +1,38 @@
-# 导入GUI、系统监控、网络、配置、绘图库等相关模块
-import tkinter as tk
-from tkinter import messagebox
+# 导入系统监控、网络、配置等相关模块；GUI和绘图库延迟到真正需要时才导入（见load_tk_modules/load_plot_modules）
 import psutil  # 系统性能监控
+import numpy as np  # 计数器差值的批量计算
 import socket  # 网络通信
+import select
+import queue
 import json    # 数据序列化
+import struct  # 二进制协议打包
+import mmap
 from datetime import datetime  # 时间戳
 import threading  # 多线程
 import configparser  # 配置文件解析
-from matplotlib.figure import Figure  # 图表对象
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg  # 嵌入Tkinter
+import argparse  # 命令行参数
+import signal
 from collections import deque  # 高效队列
-import matplotlib.pyplot as plt
-from matplotlib import font_manager  # 字体管理
 import os
+import hashlib
 import sys
 import platform
 import subprocess
+import shutil
 import time
+import bisect
+import heapq
+import importlib.util
+
+# GUI和绘图模块占位，无界面模式（--headless）下始终不加载
+tk = None           # tkinter
+messagebox = None   # tkinter.messagebox
+tk_font = None      # Tkinter界面字体
+Figure = None             # matplotlib.figure.Figure
+FigureCanvasTkAgg = None  # 嵌入Tkinter的画布
+plt = None                # matplotlib.pyplot
+font_manager = None       # matplotlib字体管理
+
 
 def get_system_fonts():
     # 获取当前操作系统中所有可用字体名称列表。
@@ -31,6 +47,63 @@ def get_system_fonts():
     return sorted(fonts)
 
 
+def get_font_cache_path():
+    # 字体缓存文件路径，三个程序共用同一份缓存
+    if platform.system() == 'Windows':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    elif platform.system() == 'Darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'perfmon', 'font_cache.json')
+
+
+def get_font_dirs_signature():
+    # 系统字体目录（含子目录）修改时间的摘要，安装或删除字体后随之变化，用于判断缓存是否失效
+    font_dirs = list(getattr(font_manager, 'X11FontDirectories', []))
+    font_dirs += getattr(font_manager, 'OSXFontDirectories', [])
+    font_dirs += getattr(font_manager, 'MSUserFontDirectories', [])
+    if platform.system() == 'Windows':
+        font_dirs.append(font_manager.win32FontDirectory())
+
+    digest = hashlib.sha1()
+    for font_dir in sorted(set(font_dirs)):
+        if not os.path.isdir(font_dir):
+            continue
+        for path, subdirs, _ in os.walk(font_dir):
+            subdirs.sort()
+            try:
+                digest.update(f"{path}:{os.stat(path).st_mtime_ns}\n".encode('utf-8', errors='replace'))
+            except OSError:
+                pass
+    return digest.hexdigest()
+
+
+def load_font_cache():
+    # 读取字体缓存，文件不存在或损坏时返回空字典
+    try:
+        with open(get_font_cache_path(), encoding='utf-8') as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_font_cache(key, signature, font):
+    # 写入字体缓存（先写临时文件再替换，避免多个程序同时启动时读到半个文件）
+    path = get_font_cache_path()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        cache = load_font_cache()
+        cache[key] = {'signature': signature, 'font': font}
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"写入字体缓存失败: {e}")
+
+
 def find_chinese_font():
     # 自动检测并返回当前系统可用的中文字体名称。
     # 优先选择常见的中文字体，保证matplotlib和Tkinter界面中文显示无乱码。
@@ -54,39 +127,115 @@ def find_chinese_font():
         ]
     # 添加通用字体备选
     candidates += ['sans-serif', 'Arial', 'Helvetica']
-    # 检查系统中实际存在的字体，返回第一个可用的
+
+    # 字体目录未变化时直接使用磁盘缓存的结果，避免每次启动都扫描全部字体
+    cache_key = '|'.join(candidates)
+    signature = get_font_dirs_signature()
+    cached = load_font_cache().get(cache_key)
+    if isinstance(cached, dict) and cached.get('signature') == signature:
+        return cached['font']
+
+    # 检查系统中实际存在的字体，选择第一个可用的；如果都没有，使用第一个备选字体
     system_fonts = get_system_fonts()
+    chosen = candidates[0] if candidates else 'sans-serif'
     for font in candidates:
         if font in system_fonts:
-            return font
-
-    # 如果都没有，返回第一个备选字体
-    return candidates[0] if candidates else 'sans-serif'
-
+            chosen = font
+            break
 
+    save_font_cache(cache_key, signature, chosen)
+    return chosen
 
-# 设置matplotlib和Tkinter的中文字体，保证跨平台中文显示
-chosen_font = find_chinese_font()
-plt.rcParams['font.sans-serif'] = [chosen_font]  # matplotlib中文字体
-plt.rcParams['axes.unicode_minus'] = False       # 负号正常显示
 
-# Tkinter界面字体设置
-if platform.system() == 'Windows':
-    tk_font = ('Microsoft YaHei', 10)
-elif platform.system() == 'Darwin':
-    tk_font = ('PingFang SC', 10)
-else:
-    tk_font = ('WenQuanYi Micro Hei', 10)
+def load_tk_modules():
+    # 导入Tkinter并设置界面字体。托盘模式同样需要Tk主循环来调度托盘菜单回调。
+    global tk, messagebox, tk_font
+    if tk is not None:
+        return
+    import tkinter as tk
+    from tkinter import messagebox
 
-print(f"Using font: {chosen_font} for matplotlib")
-print(f"Using Tkinter font: {tk_font}")
-
-# 检查是否支持GPU监控（可选依赖GPUtil）
+    # Tkinter界面字体设置
+    if platform.system() == 'Windows':
+        tk_font = ('Microsoft YaHei', 10)
+    elif platform.system() == 'Darwin':
+        tk_font = ('PingFang SC', 10)
+    else:
+        tk_font = ('WenQuanYi Micro Hei', 10)
+    print(f"Using Tkinter font: {tk_font}")
+
+
+def load_plot_modules():
+    # 导入matplotlib并设置中文字体，只在第一次显示图表窗口时执行
+    global Figure, FigureCanvasTkAgg, plt, font_manager
+    if Figure is not None:
+        return
+    from matplotlib.figure import Figure  # 图表对象
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg  # 嵌入Tkinter
+    import matplotlib.pyplot as plt
+    from matplotlib import font_manager  # 字体管理
+
+    # 设置matplotlib的中文字体，保证跨平台中文显示
+    chosen_font = find_chinese_font()
+    plt.rcParams['font.sans-serif'] = [chosen_font]  # matplotlib中文字体
+    plt.rcParams['axes.unicode_minus'] = False       # 负号正常显示
+    print(f"Using font: {chosen_font} for matplotlib")
+
+# GPU监控优先使用NVML（可选依赖pynvml），否则使用常驻的nvidia-smi查询循环（见GpuMonitor）
 try:
-    import GPUtil
-    GPU_ENABLED = True
+    import pynvml
 except ImportError:
-    GPU_ENABLED = False
+    pynvml = None
+
+# 二进制传输协议（config.ini中wire_format = binary时启用）
+# 连接建立后先写入WIRE_MAGIC声明使用二进制协议，随后是若干帧，每帧为定长帧头加帧体。
+# 帧头依次为消息类型、协议版本、样本数、帧体长度；主机名只在每个连接的HELLO帧中发送一次。
+WIRE_MAGIC = b'\x00PMB'  # 首字节为0，不可能是JSON文本的开头，接收端据此按连接协商协议
+WIRE_VERSION = 1
+MSG_HELLO = 1
+MSG_SAMPLES = 2
+MSG_EXT = 3  # 紧接其后的SAMPLES帧的扩展字段（JSON），定长结构之外的字段放在这里
+FRAME_HEADER = struct.Struct('!BBHI')
+SAMPLE_STRUCT = struct.Struct('!dffffff')  # 时间戳、CPU、内存、磁盘、上行、下行、GPU（NaN表示无）
+SAMPLE_FIELDS = ('time', 'cpu', 'mem', 'disk', 'net_up', 'net_down', 'gpu')
+
+# 长度前缀的JSON（wire_format = framed）：连接建立后先写入FRAMED_JSON_MAGIC，
+# 随后每帧为4字节帧体长度（网络字节序）加一条JSON消息，消息大小和内容不受换行分帧的限制。
+FRAMED_JSON_MAGIC = b'\x00PMJ'
+LENGTH_PREFIX = struct.Struct('!I')
+
+
+def encode_hello(name):
+    # 连接前导和HELLO帧，每个连接发送一次
+    body = name.encode('utf-8')
+    return WIRE_MAGIC + FRAME_HEADER.pack(MSG_HELLO, WIRE_VERSION, 0, len(body)) + body
+
+
+def encode_samples(samples, frame_extra=None):
+    # 将样本列表打包为SAMPLES帧，样本数超过帧头上限时拆分为多帧。
+    # 帧级附加信息（frame_extra）和样本中定长结构以外的字段放在前置的EXT帧中。
+    frames = []
+    max_count = 0xFFFF
+    for start in range(0, len(samples), max_count):
+        chunk = samples[start:start + max_count]
+        extras = [{k: v for k, v in data.items() if k not in SAMPLE_FIELDS} for data in chunk]
+        if (frame_extra and start == 0) or any(extras):
+            body = json.dumps({
+                'frame': frame_extra if start == 0 else {},
+                'samples': extras
+            }).encode()
+            frames.append(FRAME_HEADER.pack(MSG_EXT, WIRE_VERSION, len(chunk), len(body)) + body)
+        body = b''.join(
+            SAMPLE_STRUCT.pack(
+                datetime.fromisoformat(data['time']).timestamp(),
+                data['cpu'], data['mem'], data['disk'],
+                data['net_up'], data['net_down'],
+                data['gpu'] if data['gpu'] is not None else float('nan')
+            )
+            for data in chunk
+        )
+        frames.append(FRAME_HEADER.pack(MSG_SAMPLES, WIRE_VERSION, len(chunk), len(body)) + body)
+    return b''.join(frames)
 
 
 class LinuxTray:
@@ -214,29 +363,1007 @@ def open_config_file(file_path):
             print("所有尝试打开配置文件的方案都失败了")
 
 
-class PerformanceMonitor:
+class SpoolFile:
+    # 磁盘积压文件：基于内存映射的定长环形文件，只在尾部追加记录，超过容量时丢弃最旧的记录。
+    # 文件头保存读写位置（单调递增的逻辑偏移），程序重启后未发送的数据仍可继续回放。
+    HEADER = struct.Struct('<4sIQQQ')  # 标识、版本、数据区容量、读位置、写位置
+    RECORD = struct.Struct('<I')       # 每条记录前的长度字段
+    MAGIC = b'PMSP'
+    VERSION = 1
+
+    def __init__(self, path, capacity):
+        self.path = path
+        self.capacity = capacity
+        size = self.HEADER.size + capacity
+        exists = os.path.exists(path) and os.path.getsize(path) == size
+        self._file = open(path, 'r+b' if exists else 'w+b')
+        if not exists:
+            self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+
+        magic, version, cap, head, tail = self.HEADER.unpack_from(self._map, 0)
+        if magic != self.MAGIC or version != self.VERSION or cap != capacity or not 0 <= tail - head <= capacity:
+            head = tail = 0
+        self.head = head
+        self.tail = tail
+        self.dropped = 0  # 空间不足时丢弃的旧记录数
+        self._save_header()
+
+    def pending_bytes(self):
+        return self.tail - self.head
+
+    def empty(self):
+        return self.tail == self.head
+
+    def append(self, data):
+        # 追加一条记录，空间不足时从头部丢弃最旧的记录；单条记录超过容量时返回False
+        size = self.RECORD.size + len(data)
+        if size > self.capacity:
+            return False
+        while self.tail + size - self.head > self.capacity:
+            (length,) = self.RECORD.unpack(self._read(self.head, self.RECORD.size))
+            self.head += self.RECORD.size + length
+            self.dropped += 1
+        self._write(self.tail, self.RECORD.pack(len(data)) + data)
+        self.tail += size
+        self._save_header()
+        return True
+
+    def read_batch(self, max_bytes):
+        # 从头部读取若干条记录（至少一条，总长不超过max_bytes），返回(记录列表, 提交用的新读位置)
+        records = []
+        offset = self.head
+        total = 0
+        while offset < self.tail:
+            (length,) = self.RECORD.unpack(self._read(offset, self.RECORD.size))
+            if records and total + length > max_bytes:
+                break
+            records.append(self._read(offset + self.RECORD.size, length))
+            total += length
+            offset += self.RECORD.size + length
+        return records, offset
+
+    def commit(self, offset):
+        # 记录已成功发送，推进读位置
+        self.head = offset
+        self._save_header()
+
+    def close(self):
+        self._map.flush()
+        self._map.close()
+        self._file.close()
+
+    def _save_header(self):
+        self.HEADER.pack_into(self._map, 0, self.MAGIC, self.VERSION, self.capacity, self.head, self.tail)
+
+    def _write(self, offset, data):
+        # 按环形位置写入，跨越文件末尾时分两段
+        pos = offset % self.capacity
+        first = min(len(data), self.capacity - pos)
+        base = self.HEADER.size
+        self._map[base + pos:base + pos + first] = data[:first]
+        if first < len(data):
+            self._map[base:base + len(data) - first] = data[first:]
+
+    def _read(self, offset, length):
+        pos = offset % self.capacity
+        first = min(length, self.capacity - pos)
+        base = self.HEADER.size
+        data = self._map[base + pos:base + pos + first]
+        if first < length:
+            data += self._map[base:base + length - first]
+        return data
+
+
+class ConnectionManager:
+    # 到单个目标（接收端或日志服务器）的长连接管理器。
+    # 所有待发送数据先进入有界队列，由唯一的发送线程写入同一条TCP连接；
+    # 连接失败或断开后按指数退避重连，期间数据保留在队列中，队列满时丢弃最旧的数据。
+    # 连接保持stable_after秒以上后断开才从backoff_min重新退避；建立后很快被对端关闭
+    # （如接收端连接数已满）按失败处理，退避时间继续加倍。
+    # handshake为每次建立连接后首先发送的数据（如二进制协议的前导和HELLO帧）。
+    # 指定spool时断线期间的数据转存到磁盘积压文件，恢复连接后按replay_rate（字节/秒）限速批量回放。
+    def __init__(self, ip, port, timeout=2, max_queue=1000, backoff_min=0.5, backoff_max=30, handshake=None,
+                 spool=None, replay_rate=512 * 1024, replay_chunk=64 * 1024, stable_after=5):
+        self.address = (ip, port)
+        self.timeout = timeout
+        self.handshake = handshake
+        self.spool = spool
+        self.replay_rate = replay_rate
+        self.replay_chunk = replay_chunk
+        self._replay_at = 0.0
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.stable_after = stable_after
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._sock = None
+        self._backoff = backoff_min
+        self._next_attempt = 0.0
+        self._connected_at = 0.0
+        # 发送统计：最近一条数据从入队到写出的延迟、写入失败和连接失败次数、队列满丢弃的条数
+        self.latency_ms = None
+        self.send_failures = 0
+        self.connect_failures = 0
+        self.dropped = 0
+        self.disconnects = 0
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"conn-{ip}:{port}", daemon=True)
+        self._thread.start()
+
+    def send(self, data):
+        # 非阻塞入队，由发送线程异步写出
+        self._put((time.monotonic(), data))
+
+    def close(self, timeout=None):
+        # 通知发送线程退出；timeout不为空时最多等待timeout秒，让队列中剩余数据写出或转存
+        if timeout is not None:
+            self._put(None)
+            self._thread.join(timeout)
+        self._stop_event.set()
+        self._put(None)  # 唤醒发送线程
+
+    def stats(self):
+        # 发送统计，供发送端上报自身开销
+        return {
+            'latency_ms': round(self.latency_ms, 3) if self.latency_ms is not None else None,
+            'failures': self.send_failures,
+            'connect_failures': self.connect_failures,
+            'dropped': self.dropped,
+            'queue': self._queue.qsize(),
+            'spool_bytes': self.spool.pending_bytes() if self.spool is not None else 0
+        }
+
+    def gap_events(self):
+        # 可能使对端漏收数据的事件累计数：队列满丢弃、积压文件覆盖、已建立的连接断开（在途数据可能丢失）
+        return self.dropped + self.disconnects + (self.spool.dropped if self.spool is not None else 0)
+
+    def _put(self, item):
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            if self.spool is not None and not self.spool.empty():
+                # 有积压时新数据也追加到积压文件尾部，按原顺序回放
+                if not self._spool_queued():
+                    break
+                if self._ensure_connected():
+                    self._replay()
+                continue
+            item = self._queue.get()
+            if item is None:
+                break
+            self._deliver(*item)
+        self._disconnect()
+        if self.spool is not None:
+            self.spool.close()
+
+    def _deliver(self, queued_at, data):
+        # 同一条数据重试直到发送成功；启用积压文件时连接不可用则转存后返回
+        while not self._stop_event.is_set():
+            if not self._ensure_connected():
+                if self.spool is not None:
+                    self.spool.append(data)
+                    return
+                continue
+            try:
+                self._sock.sendall(data)
+                self.latency_ms = (time.monotonic() - queued_at) * 1000
+                return
+            except OSError as e:
+                print(f"连接错误 ({self.address[0]}:{self.address[1]}): {str(e)}")
+                self.send_failures += 1
+                self._disconnect()
+
+    def _spool_queued(self):
+        # 把队列中已有的数据全部转存到积压文件，收到退出标记时返回False
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return True
+            if item is None:
+                return False
+            self.spool.append(item[1])
+
+    def _replay(self):
+        # 从积压文件批量取出记录合并为一次写入，按replay_rate限速
+        delay = self._replay_at - time.monotonic()
+        if delay > 0:
+            self._stop_event.wait(min(delay, 0.5))
+            return
+        records, offset = self.spool.read_batch(self.replay_chunk)
+        data = b''.join(records)
+        try:
+            self._sock.sendall(data)
+        except OSError as e:
+            print(f"连接错误 ({self.address[0]}:{self.address[1]}): {str(e)}")
+            self.send_failures += 1
+            self._disconnect()
+            return
+        self.spool.commit(offset)
+        self._replay_at = time.monotonic() + len(data) / self.replay_rate
+
+    def _ensure_connected(self):
+        if self._sock is not None and self._peer_closed():
+            self._disconnect()
+        return self._sock is not None or self._connect()
+
+    def _connect(self):
+        # 退避时间未到时最多等待0.5秒后返回False，以便及时转存新数据；连接成功返回True
+        delay = self._next_attempt - time.monotonic()
+        if delay > 0:
+            self._stop_event.wait(min(delay, 0.5))
+            return False
+        try:
+            sock = socket.create_connection(self.address, timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            if self.handshake:
+                try:
+                    sock.sendall(self.handshake)
+                except OSError:
+                    sock.close()
+                    raise
+        except OSError as e:
+            print(f"连接错误 ({self.address[0]}:{self.address[1]}): {str(e)}")
+            self.connect_failures += 1
+            self._next_attempt = time.monotonic() + self._backoff
+            self._backoff = min(self._backoff * 2, self.backoff_max)
+            return False
+        self._sock = sock
+        self._connected_at = time.monotonic()
+        return True
+
+    def _peer_closed(self):
+        # 对端从不回写数据，连接变为可读即表示已被关闭或复位
+        try:
+            readable, _, _ = select.select([self._sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
+
+    def _disconnect(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+            self.disconnects += 1
+            now = time.monotonic()
+            if now - self._connected_at >= self.stable_after:
+                self._backoff = self.backoff_min
+            self._next_attempt = now + self._backoff
+            self._backoff = min(self._backoff * 2, self.backoff_max)
+
+
+class SampleRingBuffer:
+    # 固定容量的样本环形缓冲区，采样线程写入，界面和网络发送线程按序号读取。
+    # 每个读者自行保存游标（已读取的样本序号），互不影响；读者落后超过容量时直接跳过被覆盖的样本。
+    def __init__(self, capacity=600):
+        self._capacity = capacity
+        self._items = [None] * capacity
+        self._seq = 0  # 累计写入的样本数，同时也是下一个样本的序号
+        self._cond = threading.Condition()
+
+    def append(self, item):
+        # 写入一个样本并唤醒等待中的读者
+        with self._cond:
+            self._items[self._seq % self._capacity] = item
+            self._seq += 1
+            self._cond.notify_all()
+
+    def latest(self):
+        # 返回最新样本，缓冲区为空时返回None
+        with self._cond:
+            if self._seq == 0:
+                return None
+            return self._items[(self._seq - 1) % self._capacity]
+
+    def read_since(self, cursor):
+        # 读取序号cursor之后的所有样本，返回(新游标, 样本列表)
+        with self._cond:
+            start = max(cursor, self._seq - self._capacity)
+            items = [self._items[i % self._capacity] for i in range(start, self._seq)]
+            return self._seq, items
+
+    def wait_since(self, cursor, timeout=None):
+        # 阻塞等待新样本（最多timeout秒），然后同read_since
+        with self._cond:
+            if self._seq <= cursor:
+                self._cond.wait(timeout)
+            return self.read_since(cursor)
+
+
+class GpuMonitor:
+    # GPU采集线程：按refresh周期在后台刷新所有GPU的使用率、显存和温度，采样时只读取缓存的最新值。
+    # 优先使用NVML（pynvml）；不可用时启动一个常驻的nvidia-smi查询循环（--loop-ms），
+    # 逐行读取其输出，不再每次采样都创建nvidia-smi子进程。smi_path可指向测试用的假脚本。
+    QUERY = 'index,name,utilization.gpu,memory.used,memory.total,temperature.gpu'
+
+    def __init__(self, refresh=1.0, smi_path='nvidia-smi'):
+        self.refresh = refresh
+        self.smi_path = smi_path
+        self.backend = None  # 'nvml'、'nvidia-smi'，或None（没有可用的GPU）
+        self._gpus = {}      # index -> GPU信息
+        self._updated = 0.0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._process = None
+        self._thread = None
+
+    def start(self):
+        # 探测可用的后端并启动采集线程，返回是否有可用的GPU
+        if pynvml is not None:
+            try:
+                pynvml.nvmlInit()
+                self.backend = 'nvml'
+            except Exception as e:
+                print(f"NVML初始化失败: {str(e)}")
+        if self.backend is None and shutil.which(self.smi_path):
+            self.backend = 'nvidia-smi'
+        if self.backend is None:
+            return False
+        target = self._run_nvml if self.backend == 'nvml' else self._run_smi
+        self._thread = threading.Thread(target=target, name="gpu", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop_event.set()
+        if self._process is not None:
+            self._process.terminate()
+
+    def latest(self):
+        # 最新的GPU列表；超过3个刷新周期没有更新（采集卡住或退出）时返回空列表
+        with self._lock:
+            if time.monotonic() - self._updated > self.refresh * 3:
+                return []
+            return [dict(self._gpus[index]) for index in sorted(self._gpus)]
+
+    def _publish(self, gpu):
+        with self._lock:
+            self._gpus[gpu['index']] = gpu
+            self._updated = time.monotonic()
+
+    def _run_nvml(self):
+        while not self._stop_event.is_set():
+            try:
+                for index in range(pynvml.nvmlDeviceGetCount()):
+                    handle = pynvml.nvmlDeviceGetHandleByIndex(index)
+                    name = pynvml.nvmlDeviceGetName(handle)
+                    memory = pynvml.nvmlDeviceGetMemoryInfo(handle)
+                    self._publish({
+                        'index': index,
+                        'name': name.decode() if isinstance(name, bytes) else name,
+                        'load': float(pynvml.nvmlDeviceGetUtilizationRates(handle).gpu),
+                        'mem_used': memory.used / 1024 / 1024,  # MB
+                        'mem_total': memory.total / 1024 / 1024,
+                        'temp': float(pynvml.nvmlDeviceGetTemperature(handle, pynvml.NVML_TEMPERATURE_GPU))
+                    })
+            except Exception as e:
+                print(f"获取GPU数据失败: {str(e)}")
+            self._stop_event.wait(self.refresh)
+
+    def _run_smi(self):
+        # nvidia-smi每个周期为每块GPU输出一行；进程意外退出时等待一个周期后重启
+        command = [
+            self.smi_path, f'--query-gpu={self.QUERY}',
+            '--format=csv,noheader,nounits', f'--loop-ms={int(self.refresh * 1000)}'
+        ]
+        while not self._stop_event.is_set():
+            try:
+                self._process = subprocess.Popen(
+                    command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, bufsize=1
+                )
+                for line in self._process.stdout:
+                    gpu = self.parse_smi_line(line)
+                    if gpu is not None:
+                        self._publish(gpu)
+                self._process.wait()
+            except OSError as e:
+                print(f"启动nvidia-smi失败: {str(e)}")
+            self._stop_event.wait(self.refresh)
+
+    @staticmethod
+    def parse_smi_line(line):
+        # 解析一行CSV输出，无法解析时返回None；[N/A]等非数值字段记为None
+        fields = [field.strip() for field in line.split(',')]
+        if len(fields) != 6:
+            return None
+
+        def number(value):
+            try:
+                return float(value)
+            except ValueError:
+                return None
+
+        try:
+            index = int(fields[0])
+        except ValueError:
+            return None
+        return {
+            'index': index,
+            'name': fields[1],
+            'load': number(fields[2]),
+            'mem_used': number(fields[3]),
+            'mem_total': number(fields[4]),
+            'temp': number(fields[5])
+        }
+
+
+class CounterDelta:
+    # 计数器快照的批量差值：按名称与上一次快照对齐，用一次数组运算算出所有设备各计数器的每秒速率。
+    # 新出现的设备本次速率记为0；计数器回绕或重置（差值为负）时同样记为0。
     def __init__(self):
-        # 初始化主程序，包括主窗口、状态、配置、历史数据、界面、托盘和监控循环。
-        # 创建主窗口，设置标题、大小、透明度和背景色
-        self.root = tk.Tk()
-        self.root.title("服务器性能监视软件发送端")
-        self.root.geometry("1024x768")
-        self.root.attributes('-alpha', 0.85)
-        self.root.configure(bg='#1a1a1a')
+        self._names = []
+        self._values = None
+        self._time = None
+
+    def update(self, names, values, now):
+        # values为二维数组，每行对应names中的一个设备，每列为一个计数器
+        values = np.asarray(values, dtype=np.float64)
+        rates = np.zeros_like(values)
+        if self._values is not None and now > self._time:
+            elapsed = now - self._time
+            if names == self._names:
+                rates = (values - self._values) / elapsed
+            else:
+                index = {name: i for i, name in enumerate(self._names)}
+                rows = np.array([index.get(name, -1) for name in names], dtype=np.intp)
+                known = rows >= 0
+                rates[known] = (values[known] - self._values[rows[known]]) / elapsed
+            np.maximum(rates, 0, out=rates)
+        self._names, self._values, self._time = list(names), values, now
+        return rates
 
-        # 设置窗口图标，兼容多平台
-        if platform.system() == 'Windows':
-            self.root.iconbitmap('send.ico')
+
+class PerCoreCpuCollector:
+    # 每个逻辑核的使用率（%），总使用率会掩盖单核打满的情况
+    key = 'cpu_cores'
+
+    def __init__(self):
+        psutil.cpu_percent(interval=None, percpu=True)  # 预热
+
+    def collect(self, now):
+        return [round(value, 1) for value in psutil.cpu_percent(interval=None, percpu=True)]
+
+
+class DiskIOCollector:
+    # 每块磁盘的读写IOPS和吞吐量（KB/s）
+    key = 'disk_io'
+    FIELDS = ('read_count', 'write_count', 'read_bytes', 'write_bytes')
+
+    def __init__(self):
+        self.delta = CounterDelta()
+
+    def collect(self, now):
+        counters = psutil.disk_io_counters(perdisk=True) or {}
+        names = sorted(counters)
+        values = np.array(
+            [[getattr(counters[name], field) for field in self.FIELDS] for name in names], dtype=np.float64
+        ).reshape(-1, len(self.FIELDS))
+        rates = self.delta.update(names, values, now)
+        rates[:, 2:] /= 1024
+        return {
+            name: {'read_iops': row[0], 'write_iops': row[1], 'read_kbps': row[2], 'write_kbps': row[3]}
+            for name, row in zip(names, np.round(rates, 1).tolist())
+        }
+
+
+class NicCollector:
+    # 每块网卡的上行/下行速率（KB/s）
+    key = 'nics'
+
+    def __init__(self):
+        self.delta = CounterDelta()
+
+    def collect(self, now):
+        counters = psutil.net_io_counters(pernic=True) or {}
+        names = sorted(counters)
+        values = np.array(
+            [[counters[name].bytes_sent, counters[name].bytes_recv] for name in names], dtype=np.float64
+        ).reshape(-1, 2)
+        rates = self.delta.update(names, values, now) / 1024
+        return {
+            name: {'up': row[0], 'down': row[1]}
+            for name, row in zip(names, np.round(rates, 1).tolist())
+        }
+
+
+class PartitionCollector:
+    # 所有已挂载分区的使用率（%），光驱等无法读取的分区跳过
+    key = 'partitions'
+
+    def collect(self, now):
+        usage = {}
+        for part in psutil.disk_partitions(all=False):
+            try:
+                usage[part.mountpoint] = psutil.disk_usage(part.mountpoint).percent
+            except OSError:
+                continue
+        return usage
+
+
+class ProcessCollector:
+    # 按CPU和内存（RSS）排序的前N个进程。
+    # Process对象按PID缓存并增量维护（新PID加入、已退出的删除），不再每次用process_iter重建。
+    # 每次采样的耗时受budget_ms限制：新PID只登记，打开进程、读取名称和刷新都在预算内进行，
+    # 超出预算时本次停止，剩余进程在下一次采样时从中断处继续，
+    # 未刷新的进程沿用上次的值（其CPU使用率为距上次刷新的平均值，不会失真）。
+    # 无权访问的PID记录下来不再重试，直到该进程退出。
+    key = 'processes'
+
+    def __init__(self, top_n=5, budget_ms=20):
+        self.top_n = top_n
+        self.budget = budget_ms / 1000
+        self.procs = {}     # pid -> psutil.Process，尚未打开的新PID为None
+        self.values = {}    # pid -> (name, cpu, rss)
+        self.denied = set()  # 无权访问的PID
+        self.pending = deque()  # 本轮尚未刷新的PID
+
+    def collect(self, now):
+        started = time.perf_counter()
+        pids = set(psutil.pids())
+        for pid in list(self.procs):
+            if pid not in pids:
+                del self.procs[pid]
+                self.values.pop(pid, None)
+        self.denied &= pids
+        for pid in pids - self.procs.keys() - self.denied:
+            self.procs[pid] = None
+            self.pending.append(pid)
+
+        if not self.pending:
+            self.pending.extend(self.procs)
+        refreshed = 0
+        while self.pending and time.perf_counter() - started < self.budget:
+            pid = self.pending.popleft()
+            if pid not in self.procs:
+                continue
+            proc = self.procs[pid]
+            try:
+                if proc is None:
+                    # 新进程：打开并预热CPU计数，使用率从下次刷新起才有意义
+                    proc = psutil.Process(pid)
+                    with proc.oneshot():
+                        proc.cpu_percent(interval=None)
+                        self.values[pid] = (proc.name(), 0.0, proc.memory_info().rss)
+                    self.procs[pid] = proc
+                    continue
+                with proc.oneshot():
+                    self.values[pid] = (self.values[pid][0], proc.cpu_percent(interval=None), proc.memory_info().rss)
+                refreshed += 1
+            except (psutil.NoSuchProcess, psutil.ZombieProcess):
+                del self.procs[pid]
+                self.values.pop(pid, None)
+            except psutil.AccessDenied:
+                del self.procs[pid]
+                self.values.pop(pid, None)
+                self.denied.add(pid)
+
+        def describe(item):
+            pid, (name, cpu, rss) = item
+            return {'pid': pid, 'name': name, 'cpu': round(cpu, 1), 'rss_mb': round(rss / 1024 / 1024, 1)}
+
+        items = self.values.items()
+        return {
+            'top_cpu': [describe(item) for item in heapq.nlargest(self.top_n, items, key=lambda item: item[1][1])],
+            'top_mem': [describe(item) for item in heapq.nlargest(self.top_n, items, key=lambda item: item[1][2])],
+            'count': len(pids),
+            'refreshed': refreshed,
+            'cost_ms': round((time.perf_counter() - started) * 1000, 3)
+        }
+
+
+class PluginCollector:
+    # 插件采集器：加载plugin_dir目录中的*.py插件（以_开头的文件跳过），每个插件定义collect()函数，
+    # 返回值（可JSON序列化）以插件名为key合并到样本的plugins字段中。插件可定义NAME和TIMEOUT_MS覆盖默认值。
+    # 每个插件在自己的工作线程（守护线程）中异步执行，采样时只触发一次执行并读取最近一次完成的结果，
+    # 卡住的插件不会阻塞采样线程，也不会占用其他插件的线程或妨碍程序退出；
+    # 运行超过超时时间的插件结果记为超时，直到该次调用返回后才会再次执行。
+    key = 'plugins'
+
+    def __init__(self, plugin_dir='plugins', timeout_ms=2000):
+        self.timeout = timeout_ms / 1000
+        self.plugins = self.load_plugins(plugin_dir)
+        self.results = {}   # 插件名 -> 最近一次的结果
+        self.started = {}   # 插件名 -> 正在执行的调用的开始时间
+        self._lock = threading.Lock()
+        self._triggers = {}
+        for name, module in self.plugins.items():
+            self._triggers[name] = threading.Event()
+            threading.Thread(target=self._run, args=(name, module), name=f"plugin-{name}", daemon=True).start()
+
+    @staticmethod
+    def load_plugins(plugin_dir):
+        plugins = {}
+        if not plugin_dir or not os.path.isdir(plugin_dir):
+            return plugins
+        for filename in sorted(os.listdir(plugin_dir)):
+            if not filename.endswith('.py') or filename.startswith('_'):
+                continue
+            path = os.path.join(plugin_dir, filename)
+            try:
+                spec = importlib.util.spec_from_file_location(f"perfmon_plugin_{filename[:-3]}", path)
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+                if not callable(getattr(module, 'collect', None)):
+                    print(f"插件{filename}缺少collect函数，已跳过")
+                    continue
+            except Exception as e:
+                print(f"加载插件{filename}失败: {str(e)}")
+                continue
+            plugins[getattr(module, 'NAME', filename[:-3])] = module
+            print(f"已加载插件: {filename}")
+        return plugins
+
+    def collect(self, now):
+        if not self.plugins:
+            return None
+        with self._lock:
+            for name, module in self.plugins.items():
+                started = self.started.get(name)
+                if started is None:
+                    self.started[name] = now
+                    self._triggers[name].set()
+                elif now - started > getattr(module, 'TIMEOUT_MS', self.timeout * 1000) / 1000:
+                    self.results[name] = {'error': 'timeout'}
+            return dict(self.results)
+
+    def _run(self, name, module):
+        trigger = self._triggers[name]
+        while True:
+            trigger.wait()
+            trigger.clear()
+            try:
+                result = module.collect()
+            except Exception as e:
+                result = {'error': str(e)}
+            with self._lock:
+                self.results[name] = result
+                self.started.pop(name, None)
+
+
+# 可在config.ini的collectors项中启用的扩展采集器，按名称选择，逗号分隔
+COLLECTORS = {
+    'cpu_cores': PerCoreCpuCollector,
+    'disk_io': DiskIOCollector,
+    'nics': NicCollector,
+    'partitions': PartitionCollector,
+    'processes': ProcessCollector,
+    'plugins': PluginCollector
+}
+
+
+def create_collectors(names, options=None):
+    # 按名称创建扩展采集器，未知名称忽略并提示；options按名称给出各采集器的构造参数
+    options = options or {}
+    collectors = []
+    for name in names.split(','):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in COLLECTORS:
+            print(f"未知的采集器: {name}")
+            continue
+        collectors.append(COLLECTORS[name](**options.get(name, {})))
+    return collectors
+
+
+class LatencyHistogram:
+    # 固定分桶的耗时直方图（毫秒），计数自程序启动起累计，接收端可自行做差得到区间分布
+    BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)  # 各桶上界，最后一个桶为超过1000ms
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS_MS) + 1)
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value_ms):
+        self.counts[bisect.bisect_left(self.BOUNDS_MS, value_ms)] += 1
+        self.total += value_ms
+        self.max = max(self.max, value_ms)
+
+    def snapshot(self):
+        count = sum(self.counts)
+        return {
+            'counts': list(self.counts),
+            'avg': round(self.total / count, 3) if count else 0.0,
+            'max': round(self.max, 3)
+        }
+
+
+class PeriodicScheduler:
+    # 基于单调时钟的周期调度
+    # 以绝对的周期时刻为目标，任务耗时不会累积成漂移；第一个周期时刻对齐到墙上时钟的整周期，
+    # 使时钟同步的各主机在同一时刻采样。错过周期时按策略处理：skip跳到下一个未来的周期时刻，
+    # catchup立即连续补执行（最多补max_catchup个，更早的直接跳过）。
+    def __init__(self, interval, policy='skip', max_catchup=5):
+        self.interval = interval
+        self.policy = policy
+        self.max_catchup = max_catchup
+        self.next_deadline = None
+        self.ticks = 0
+        self.missed = 0
+        self.jitter = LatencyHistogram()   # 实际开始时刻与目标时刻之差
+        self.latency = LatencyHistogram()  # 每次采集耗时
+
+    def wait_time(self):
+        # 距离下一个目标时刻的秒数
+        if self.next_deadline is None:
+            offset = self.interval - (time.time() % self.interval)
+            self.next_deadline = time.monotonic() + offset
+        return max(0.0, self.next_deadline - time.monotonic())
+
+    def begin(self):
+        # 任务开始：记录调度抖动，返回(开始时间, 抖动毫秒数)
+        now = time.monotonic()
+        jitter_ms = abs(now - self.next_deadline) * 1000
+        self.jitter.record(jitter_ms)
+        return now, jitter_ms
+
+    def end(self, started):
+        # 任务结束：记录耗时并推进到下一个目标时刻，返回本次耗时（毫秒）
+        now = time.monotonic()
+        latency_ms = (now - started) * 1000
+        self.latency.record(latency_ms)
+        self.ticks += 1
+        self.next_deadline += self.interval
+        if self.next_deadline <= now:
+            behind = int((now - self.next_deadline) // self.interval) + 1
+            skipped = behind if self.policy != 'catchup' else max(0, behind - self.max_catchup)
+            self.next_deadline += skipped * self.interval
+            self.missed += skipped
+        return latency_ms
+
+    def set_interval(self, interval):
+        # 修改周期：下一个目标时刻改为按新周期从上一个目标时刻推算，已过期时立即执行
+        if self.next_deadline is not None:
+            self.next_deadline += interval - self.interval
+        self.interval = interval
+
+    def stats(self):
+        # 调度统计，随数据帧发送
+        return {
+            'interval_ms': round(self.interval * 1000, 3),
+            'policy': self.policy,
+            'ticks': self.ticks,
+            'missed': self.missed,
+            'bounds_ms': list(LatencyHistogram.BOUNDS_MS),
+            'jitter_ms': self.jitter.snapshot(),
+            'collect_ms': self.latency.snapshot()
+        }
+
+
+class AdaptiveSampler:
+    # 自适应采样周期：指标平稳时每次把周期放大backoff倍，直到max_interval；
+    # 相邻两次采样的变化超过change_threshold（百分点，网络速率按相对变化的百分比），
+    # 或任一指标达到告警阈值时，立即切换到min_interval。
+    RATE_FLOOR = 64  # 网络速率低于该值（KB/s）时按该值计算相对变化，避免空闲时的小波动触发加速
+
+    def __init__(self, min_interval, max_interval, change_threshold=5.0, alerts=None, backoff=2.0):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.change_threshold = change_threshold
+        self.alerts = alerts or {}  # 指标名 -> 告警阈值
+        self.backoff = backoff
+        self.interval = min_interval
+        self._last = None
+
+    def update(self, sample):
+        # 根据最新样本计算下一次的采样周期（秒）
+        last, self._last = self._last, sample
+        alert = any(
+            sample.get(key) is not None and sample[key] >= limit
+            for key, limit in self.alerts.items()
+        )
+        if last is None or alert or self.change(last, sample) >= self.change_threshold:
+            self.interval = self.min_interval
         else:
+            self.interval = min(self.max_interval, self.interval * self.backoff)
+        return self.interval
+
+    def change(self, last, sample):
+        # 两个样本之间的最大变化幅度
+        change = max(abs(sample[key] - last[key]) for key in ('cpu', 'mem', 'disk'))
+        for key in ('net_up', 'net_down'):
+            base = max(last[key], sample[key], self.RATE_FLOOR)
+            change = max(change, abs(sample[key] - last[key]) / base * 100)
+        if sample['gpu'] is not None and last['gpu'] is not None:
+            change = max(change, abs(sample['gpu'] - last['gpu']))
+        return change
+
+
+class CollectorEngine:
+    # 独立的采样线程：按调度器给出的周期时刻调用采集函数，并把结果写入环形缓冲区。
+    # 采集过程不再占用Tk主线程，托盘和窗口在采样期间保持响应。
+    def __init__(self, collect, buffer, scheduler, adaptive=None):
+        self.collect = collect
+        self.buffer = buffer
+        self.scheduler = scheduler
+        self.adaptive = adaptive  # AdaptiveSampler，为None时固定周期采样
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="collector", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.wait(self.scheduler.wait_time()):
+            started, jitter_ms = self.scheduler.begin()
             try:
-                from tkinter import PhotoImage
-                icon = PhotoImage(file='send.png')
-                self.root.iconphoto(True, icon)
+                sample = self.collect()
             except Exception as e:
-                print(f"设置图标失败: {e}")
+                sample = None
+                print(f"数据采集异常: {str(e)}")
+            collect_ms = self.scheduler.end(started)
+            if sample is not None:
+                # 每个样本附带本次的调度抖动和采集耗时
+                sample['jitter_ms'] = round(jitter_ms, 3)
+                sample['collect_ms'] = round(collect_ms, 3)
+                self.buffer.append(sample)
+                if self.adaptive is not None:
+                    self.scheduler.set_interval(self.adaptive.update(sample))
+
+
+class SampleBatcher:
+    # 发送端的批量缓冲：样本先在本地累积，满max_samples个或距第一个样本超过max_delay_ms（先到者）时合并成一帧。
+    # max_samples为1时每个样本单独成帧，与未启用批量时一致。
+    def __init__(self, max_samples=1, max_delay_ms=1000):
+        self.max_samples = max(1, max_samples)
+        self.max_delay = max_delay_ms / 1000
+        self._items = []
+        self._first_time = 0.0
+
+    def add(self, item):
+        if not self._items:
+            self._first_time = time.monotonic()
+        self._items.append(item)
+
+    def time_until_flush(self):
+        # 距离按时间刷新还需等待的秒数，缓冲为空时返回None
+        if not self._items:
+            return None
+        return max(0.0, self._first_time + self.max_delay - time.monotonic())
+
+    def ready(self):
+        return bool(self._items) and (
+            len(self._items) >= self.max_samples or self.time_until_flush() == 0
+        )
+
+    def drain(self):
+        items, self._items = self._items, []
+        return items
+
+
+class WindowAggregator:
+    # 发送端的窗口聚合：快速采样得到的样本每window_ms毫秒合并为一条记录再发送。
+    # 记录的主字段取窗口内最后一个样本的值，agg字段给出各指标在窗口内的min/max/avg，
+    # 窗口内的短时尖峰不会因为只发送一条记录而丢失。
+    FIELDS = ('cpu', 'mem', 'disk', 'net_up', 'net_down', 'gpu')
+
+    def __init__(self, window_ms):
+        self.window = window_ms / 1000
+        self._items = []
+        self._start = 0.0
+
+    def add(self, item):
+        # 加入一个样本；当前窗口已结束时先结束该窗口，返回其聚合记录，否则返回None
+        record = self.drain() if self.ready() else None
+        if not self._items:
+            self._start = time.monotonic()
+        self._items.append(item)
+        return record
+
+    def time_until_flush(self):
+        # 距离当前窗口结束的秒数，窗口为空时返回None
+        if not self._items:
+            return None
+        return max(0.0, self._start + self.window - time.monotonic())
 
-        # 启动时先隐藏主窗口（托盘模式）
-        self.root.withdraw()
+    def ready(self):
+        return bool(self._items) and self.time_until_flush() == 0
+
+    def drain(self):
+        # 结束当前窗口，返回聚合记录（窗口为空时返回None）
+        items, self._items = self._items, []
+        if not items:
+            return None
+        record = dict(items[-1])
+        agg = {'count': len(items), 'window_ms': round(self.window * 1000)}
+        for key in self.FIELDS:
+            values = [item[key] for item in items if item.get(key) is not None]
+            if values:
+                agg[key] = {
+                    'min': min(values),
+                    'max': max(values),
+                    'avg': round(sum(values) / len(values), 3)
+                }
+        record['agg'] = agg
+        return record
+
+
+class DeltaEncoder:
+    # 差量编码（仅用于JSON传输格式）：每keyframe_interval个样本发送一个完整的关键帧，
+    # 其间的样本带delta标记，只包含相对上次发送的值变化超过该指标epsilon的字段（无epsilon的字段按是否相等判断），
+    # 其余字段由接收端沿用上一次的值。比较基准是上次发送的值而非上次采集的值，误差不会累积超过epsilon。
+    # 消失的字段以None发送一次。每个样本带递增的seq，接收端发现seq不连续（有样本丢失）时
+    # 丢弃差量直到下一个关键帧；发送端发现连接上可能丢过数据时调用reset，下一个样本立即发送关键帧。
+    DEFAULT_EPSILONS = {
+        'cpu': 1.0, 'mem': 0.5, 'disk': 0.1, 'net_up': 1.0, 'net_down': 1.0, 'gpu': 1.0,
+        'jitter_ms': 5.0, 'collect_ms': 5.0
+    }
+
+    def __init__(self, keyframe_interval=30, epsilons=None):
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.epsilons = dict(self.DEFAULT_EPSILONS, **(epsilons or {}))
+        self._last = None
+        self._count = 0
+        self._seq = 0
+
+    def reset(self):
+        self._last = None
+
+    def encode(self, sample):
+        self._seq += 1
+        if self._last is None or self._count >= self.keyframe_interval:
+            self._last = dict(sample)
+            self._count = 1
+            return dict(sample, seq=self._seq)
+
+        delta = {'time': sample['time'], 'delta': 1, 'seq': self._seq}
+        for key, value in sample.items():
+            if key == 'time':
+                continue
+            last = self._last.get(key)
+            epsilon = self.epsilons.get(key)
+            if epsilon is not None and isinstance(value, (int, float)) and isinstance(last, (int, float)):
+                changed = abs(value - last) > epsilon
+            else:
+                changed = key not in self._last or value != last
+            if changed:
+                delta[key] = value
+                self._last[key] = value
+        for key in [key for key in self._last if key not in sample]:
+            delta[key] = None
+            del self._last[key]
+        self._count += 1
+        return delta
+
+    @staticmethod
+    def parse_epsilons(text):
+        # 解析“指标:epsilon”的逗号分隔列表，格式错误的项忽略
+        epsilons = {}
+        for item in text.split(','):
+            key, _, value = item.partition(':')
+            try:
+                epsilons[key.strip()] = float(value)
+            except ValueError:
+                continue
+        return epsilons
+
+
+class PerformanceMonitor:
+    def __init__(self, headless=False):
+        # 初始化主程序，包括配置、采样引擎、网络连接，以及（非无界面模式下的）主窗口和托盘。
+        # headless为True时只运行采样和发送，不导入任何GUI或绘图模块。
+        self.headless = headless
+        self.root = None
+        self.ui_ready = False  # 图表窗口在第一次从托盘恢复时才创建
+        self.window_visible = False  # 窗口隐藏时只更新历史数据，不重绘图表
 
         # 初始化运行状态、定时器、托盘菜单等
         self.running = True
@@ -257,16 +1384,183 @@ class PerformanceMonitor:
             'gpu': deque(maxlen=60)     # GPU历史
         }
 
-        # 初始化界面组件和事件绑定
-        self.init_ui()
-        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        # 采样周期（毫秒），采样线程与界面刷新共用
+        self.sample_interval = self.config.getint('sender', 'sample_interval', fallback=1000)
+
+        # 采样引擎：独立线程采样并写入环形缓冲区，界面和网络发送各自按游标读取
+        self.samples = SampleRingBuffer()
+        self.ui_cursor = 0
+        self._last_net = None
+        psutil.cpu_percent(interval=None)  # 预热，之后的调用返回距上次调用的平均使用率
+
+        # 发送端自身开销的统计（随每一帧上报，见agent_stats）
+        self.agent_process = psutil.Process()
+        self.agent_process.cpu_percent(interval=None)
+        self.collect_timings = {}  # 最近一次采样中各采集器的耗时（毫秒）
+        self.serialize_ms = 0.0    # 最近一帧的序列化耗时（毫秒）
+        self.scheduler = PeriodicScheduler(
+            self.sample_interval / 1000,
+            policy=self.config.get('sender', 'schedule_policy', fallback='skip')
+        )
+        # 扩展采集器（每核CPU、每盘IO、每网卡流量、各分区使用率、前N个进程、插件）
+        self.collectors = create_collectors(
+            self.config.get('sender', 'collectors', fallback=','.join(COLLECTORS)),
+            {'processes': {
+                'top_n': self.config.getint('sender', 'top_processes', fallback=5),
+                'budget_ms': self.config.getfloat('sender', 'process_budget_ms', fallback=20)
+            }, 'plugins': {
+                'plugin_dir': self.config.get('sender', 'plugin_dir', fallback='plugins'),
+                'timeout_ms': self.config.getint('sender', 'plugin_timeout', fallback=2000)
+            }}
+        )
+        # GPU在独立线程中按gpu_refresh周期采集，采样时只读取缓存值
+        self.gpu = GpuMonitor(
+            self.config.getint('sender', 'gpu_refresh', fallback=1000) / 1000,
+            self.config.get('sender', 'nvidia_smi_path', fallback='nvidia-smi')
+        )
+        self.gpu_enabled = self.gpu.start()
+        self.engine = CollectorEngine(self.get_performance, self.samples, self.scheduler, self.create_adaptive_sampler())
+
+        # 调度统计（抖动、采集耗时直方图）每隔sched_stats_interval秒随数据帧发送一次
+        self.sched_stats_interval = self.config.getint('sender', 'sched_stats_interval', fallback=60)
+        self.sched_stats_sent = 0.0
+
+        # 批量发送：满batch_size个样本或超过batch_interval毫秒时合并成一帧
+        self.batcher = SampleBatcher(
+            self.config.getint('sender', 'batch_size', fallback=1),
+            self.config.getint('sender', 'batch_interval', fallback=1000)
+        )
+
+        # 窗口聚合：aggregate_window大于0时，每个窗口只发送一条带min/max/avg的记录
+        aggregate_window = self.config.getint('sender', 'aggregate_window', fallback=0)
+        self.aggregator = WindowAggregator(aggregate_window) if aggregate_window > 0 else None
+
+        # 传输格式：json（默认，换行分隔）、framed（长度前缀的JSON）
+        # 或binary（紧凑二进制，主机名每个连接只发送一次）
+        self.wire_format = self.config.get('sender', 'wire_format', fallback='json')
+
+        # 差量编码：只对JSON格式生效，二进制格式的定长样本结构总是包含全部字段
+        self.delta = None
+        self.delta_gaps = 0  # 上次编码时各接收端连接的gap_events之和
+        if self.config.getboolean('sender', 'delta_encoding', fallback=False):
+            if self.wire_format in ('json', 'framed'):
+                self.delta = DeltaEncoder(
+                    self.config.getint('sender', 'keyframe_interval', fallback=30),
+                    DeltaEncoder.parse_epsilons(self.config.get('sender', 'delta_epsilon', fallback=''))
+                )
+            else:
+                print("差量编码只支持json传输格式，已忽略delta_encoding")
+
+        # 到每个接收端和日志服务器的长连接，各自有独立的发送线程、队列和积压文件，
+        # 慢的或断开的目标不会拖慢其他目标；断线期间的数据转存到积压文件
+        replay_rate = self.config.getint('sender', 'replay_rate', fallback=512) * 1024
+        handshake = None
+        if self.wire_format == 'binary':
+            handshake = encode_hello(self.config['sender']['computer_name'])
+        elif self.wire_format == 'framed':
+            handshake = FRAMED_JSON_MAGIC
+        self.receiver_conns = [
+            ConnectionManager(
+                ip, port,
+                handshake=handshake,
+                spool=self.open_spool(f'{spool_name}_{self.wire_format}'),
+                replay_rate=replay_rate
+            )
+            for ip, port, spool_name in self.receiver_addresses()
+        ]
+        # log_via_receiver开启时只连接接收端，日志由接收端批量转发到日志服务器
+        self.log_conn = None
+        if not self.config.getboolean('sender', 'log_via_receiver', fallback=False):
+            self.log_conn = ConnectionManager(
+                self.config['sender']['log_server_ip'],
+                self.config.getint('sender', 'log_server_port'),
+                spool=self.open_spool('log_server'),
+                replay_rate=replay_rate
+            )
 
-        # 创建系统托盘图标（多平台适配）
-        self.create_system_tray()
+        if not headless:
+            self.create_main_window()
+            # 创建系统托盘图标（多平台适配）
+            self.create_system_tray()
 
         # 启动性能监控主循环
         self.start_monitoring()
 
+    def create_main_window(self):
+        # 创建（隐藏的）主窗口，图表等界面组件延迟到第一次显示时创建
+        load_tk_modules()
+
+        # 创建主窗口，设置标题、大小、透明度和背景色
+        self.root = tk.Tk()
+        self.root.title("服务器性能监视软件发送端")
+        self.root.geometry("1024x768")
+        self.root.attributes('-alpha', 0.85)
+        self.root.configure(bg='#1a1a1a')
+
+        # 设置窗口图标，兼容多平台
+        if platform.system() == 'Windows':
+            self.root.iconbitmap('send.ico')
+        else:
+            try:
+                from tkinter import PhotoImage
+                icon = PhotoImage(file='send.png')
+                self.root.iconphoto(True, icon)
+            except Exception as e:
+                print(f"设置图标失败: {e}")
+
+        # 启动时先隐藏主窗口（托盘模式）
+        self.root.withdraw()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # 跟踪窗口是否可见（最小化、隐藏到托盘时为不可见）
+        self.root.bind('<Map>', self.on_window_map)
+        self.root.bind('<Unmap>', self.on_window_unmap)
+
+    def create_adaptive_sampler(self):
+        # adaptive_sampling开启时按配置创建自适应采样器，否则返回None（固定sample_interval周期）
+        if not self.config.getboolean('sender', 'adaptive_sampling', fallback=False):
+            return None
+        alerts = {}
+        for key in ('cpu', 'mem', 'disk', 'gpu'):
+            limit = self.config.getfloat('sender', f'{key}_alert', fallback=0)
+            if limit > 0:
+                alerts[key] = limit
+        return AdaptiveSampler(
+            self.config.getint('sender', 'min_interval', fallback=250) / 1000,
+            self.config.getint('sender', 'max_interval', fallback=5000) / 1000,
+            change_threshold=self.config.getfloat('sender', 'change_threshold', fallback=5),
+            alerts=alerts
+        )
+
+    def receiver_addresses(self):
+        # 接收端列表：receivers为逗号分隔的“地址:端口”，未配置时使用receiver_ip/receiver_port。
+        # 返回(地址, 端口, 积压文件名)，单接收端配置沿用原来的积压文件名
+        receivers = self.config.get('sender', 'receivers', fallback='').strip()
+        if not receivers:
+            return [(self.config['sender']['receiver_ip'], self.config.getint('sender', 'receiver_port'), 'receiver')]
+        addresses = []
+        for item in receivers.split(','):
+            ip, _, port = item.strip().rpartition(':')
+            if not ip or not port.isdigit():
+                print(f"接收端地址格式错误: {item.strip()}")
+                continue
+            ip = ip.strip('[]')  # 允许[IPv6地址]:端口
+            addresses.append((ip, int(port), f"receiver_{ip.replace(':', '-')}_{port}"))
+        return addresses
+
+    def open_spool(self, name):
+        # 打开指定目标的积压文件，spool_dir为空时不启用；文件名区分传输格式，避免切换格式后回放出错
+        spool_dir = self.config.get('sender', 'spool_dir', fallback='spool')
+        if not spool_dir:
+            return None
+        try:
+            os.makedirs(spool_dir, exist_ok=True)
+            capacity = self.config.getint('sender', 'spool_size', fallback=16) * 1024 * 1024
+            return SpoolFile(os.path.join(spool_dir, f'{name}.spool'), capacity)
+        except Exception as e:
+            print(f"打开积压文件失败: {str(e)}")
+            return None
+
     def create_system_tray(self):
        # 创建系统托盘图标，自动适配Windows、Linux、macOS等平台。
        # 优先使用pystray/AppIndicator/rumps，失败则回退Tkinter菜单。
@@ -445,11 +1739,34 @@ class PerformanceMonitor:
             return None
 
     def restore_from_tray(self):
-        # 从托盘恢复窗口
+        # 从托盘恢复窗口，第一次显示时才创建图表
+        if not self.ui_ready:
+            self.init_ui()
         self.root.deiconify()
         self.root.lift()
         self.root.focus_set()
         self.root.state('normal')
+        self.window_visible = True
+
+        # 隐藏期间没有绘图，恢复时补画一次最新数据
+        self.update_history()
+        latest = self.samples.latest()
+        if latest is not None:
+            self.update_ui(latest)
+
+    def on_window_map(self, event):
+        # 窗口重新显示（如从最小化恢复）：立即补画一次
+        if event.widget is self.root and not self.window_visible:
+            self.window_visible = True
+            latest = self.samples.latest()
+            if self.ui_ready and latest is not None:
+                self.update_history()
+                self.update_ui(latest)
+
+    def on_window_unmap(self, event):
+        # 窗口被最小化或隐藏：停止绘图
+        if event.widget is self.root:
+            self.window_visible = False
 
     def open_config(self):
         # 打开配置文件
@@ -471,15 +1788,53 @@ class PerformanceMonitor:
             'computer_name': socket.gethostname(),
             'receiver_ip': '127.0.0.1',
             'receiver_port': '9999',
+            'receivers': '',
             'log_server_ip': '127.0.0.1',
-            'log_server_port': '8888'
+            'log_server_port': '8888',
+            'log_via_receiver': 'false',
+            'sample_interval': '1000',
+            'schedule_policy': 'skip',
+            'adaptive_sampling': 'false',
+            'min_interval': '250',
+            'max_interval': '5000',
+            'change_threshold': '5',
+            'cpu_alert': '80',
+            'mem_alert': '90',
+            'sched_stats_interval': '60',
+            'collectors': 'cpu_cores, disk_io, nics, partitions, processes, plugins',
+            'plugin_dir': 'plugins',
+            'plugin_timeout': '2000',
+            'gpu_refresh': '1000',
+            'nvidia_smi_path': 'nvidia-smi',
+            'top_processes': '5',
+            'process_budget_ms': '20',
+            'batch_size': '1',
+            'batch_interval': '1000',
+            'aggregate_window': '0',
+            'wire_format': 'json',
+            'delta_encoding': 'false',
+            'keyframe_interval': '30',
+            'delta_epsilon': 'cpu:1, mem:0.5, disk:0.1, net_up:1, net_down:1, gpu:1',
+            'spool_dir': 'spool',
+            'spool_size': '16',
+            'replay_rate': '512'
         }
         with open('config.ini', 'w') as configfile:
             config.write(configfile)
 
+    def stop_services(self, timeout=None):
+        # 停止采样线程和网络连接；timeout不为空时等待发送线程把已入队的数据处理完
+        self.running = False
+        self.engine.stop()
+        self.gpu.stop()
+        for conn in self.receiver_conns:
+            conn.close(timeout)
+        if self.log_conn is not None:
+            self.log_conn.close(timeout)
+
     def exit_app(self):
         # 退出应用程序
-        self.running = False
+        self.stop_services()
         if self.after_id:
             self.root.after_cancel(self.after_id)
         self.root.destroy()
@@ -487,14 +1842,34 @@ class PerformanceMonitor:
 
     def init_ui(self):
         # 初始化用户界面组件
+        load_plot_modules()
+
         # 创建图表
         self.figure = Figure(figsize=(10, 6), facecolor='#1a1a1a')
         self.ax = self.figure.add_subplot(111)
         self.ax.set_facecolor('#1a1a1a')
         self.ax.tick_params(colors='white')
+        self.ax.set_xlim(0, self.history['cpu'].maxlen - 1)
+        self.ax.set_ylim(0, 100)
+        self.ax.set_xlabel('时间（秒）', color='white')
+        self.ax.set_ylabel('使用率 (%)', color='white')
+
+        # 曲线只创建一次，之后用set_data更新；animated的曲线不参与整图重绘，由update_ui单独绘制
+        lines = [('cpu', 'CPU', 'cyan'), ('mem', '内存', 'yellow'), ('disk', '磁盘', 'magenta')]
+        if self.gpu_enabled:
+            lines.append(('gpu', 'GPU', 'red'))
+        self.lines = {}
+        for key, label, color in lines:
+            self.lines[key], = self.ax.plot([], [], label=label, color=color, alpha=0.8, animated=True)
+        self.ax.legend(facecolor='#1a1a1a', labelcolor='white')
+
         self.canvas = FigureCanvasTkAgg(self.figure, master=self.root)
         self.canvas.get_tk_widget().pack(expand=True, fill=tk.BOTH, padx=20, pady=20)
 
+        # 整图重绘（首次显示、窗口缩放）后缓存不含曲线的背景，供blit使用
+        self.background = None
+        self.canvas.mpl_connect('draw_event', self.on_canvas_draw)
+
         # 实时数据状态栏
         self.status_frame = tk.Frame(self.root, bg='#1a1a1a')
         self.status_frame.pack(pady=10)
@@ -504,7 +1879,7 @@ class PerformanceMonitor:
             ('磁盘', 'magenta'), ('上行', 'green'),
             ('下行', 'blue')
         ]
-        if GPU_ENABLED:
+        if self.gpu_enabled:
             status_labels.append(('GPU', 'red'))
 
         self.status_vars = {}
@@ -516,10 +1891,15 @@ class PerformanceMonitor:
             tk.Label(frame, textvariable=var, fg='white', bg='#1a1a1a', font=tk_font).pack(side=tk.LEFT)
             self.status_vars[text] = var
 
+        self.ui_ready = True
+
     def get_performance(self):
-        # 获取系统性能指标
-        # CPU使用率
-        cpu = psutil.cpu_percent(interval=0.5)
+        # 获取系统性能指标（在采样线程中执行，不得阻塞等待）
+        started = time.perf_counter()
+        timings = {}
+
+        # CPU使用率：非阻塞调用，返回距上次采样的平均值
+        cpu = psutil.cpu_percent(interval=None)
 
         # 内存使用率
         mem = psutil.virtual_memory().percent
@@ -527,28 +1907,23 @@ class PerformanceMonitor:
         # 磁盘使用率
         disk = psutil.disk_usage('/').percent if platform.system() != 'Windows' else psutil.disk_usage('C:').percent
 
-        # 网络流量 - 计算差值
+        # 网络流量 - 与上次采样的计数器做差值计算速率
         net = psutil.net_io_counters()
-        net_up = net.bytes_sent
-        net_down = net.bytes_recv
-
-        # 等待1秒后再次采样计算速率
-        time.sleep(1)
-        net2 = psutil.net_io_counters()
-        net_up_speed = (net2.bytes_sent - net_up) / 1024  # KB/s
-        net_down_speed = (net2.bytes_recv - net_down) / 1024  # KB/s
-
-        # GPU使用率（如果可用）
-        gpu_load = None
-        if GPU_ENABLED:
-            try:
-                gpus = GPUtil.getGPUs()
-                if gpus:
-                    gpu_load = gpus[0].load * 100
-            except Exception as e:
-                print(f"获取GPU数据失败: {str(e)}")
-
-        return {
+        now = time.monotonic()
+        net_up_speed = net_down_speed = 0.0
+        if self._last_net is not None:
+            last_time, last_sent, last_recv = self._last_net
+            elapsed = now - last_time
+            if elapsed > 0:
+                net_up_speed = (net.bytes_sent - last_sent) / elapsed / 1024  # KB/s
+                net_down_speed = (net.bytes_recv - last_recv) / elapsed / 1024  # KB/s
+        self._last_net = (now, net.bytes_sent, net.bytes_recv)
+
+        # GPU使用率（如果可用）：gpu为第一块GPU的使用率，gpus为所有GPU的详细信息
+        gpus = self.gpu.latest() if self.gpu_enabled else []
+        gpu_load = gpus[0]['load'] if gpus else None
+
+        data = {
             'time': datetime.now().isoformat(),
             'cpu': cpu,
             'mem': mem,
@@ -557,31 +1932,43 @@ class PerformanceMonitor:
             'net_down': net_down_speed,
             'gpu': gpu_load
         }
+        if gpus:
+            data['gpus'] = gpus
+        timings['base'] = round((time.perf_counter() - started) * 1000, 3)
 
-    def update_ui(self, data):
-        # 更新界面显示
-        # 清除旧图表
-        self.ax.clear()
-
-        # 绘制新数据
-        lines = [
-            (self.history['cpu'], 'CPU', 'cyan'),
-            (self.history['mem'], '内存', 'yellow'),
-            (self.history['disk'], '磁盘', 'magenta')
-        ]
-        if GPU_ENABLED and self.history['gpu']:
-            lines.append((self.history['gpu'], 'GPU', 'red'))
-
-        for values, label, color in lines:
-            if values:
-                self.ax.plot(values, label=label, color=color, alpha=0.8)
+        # 扩展采集器的结果以各自的key附加到样本中（返回None表示本次没有数据）
+        for collector in self.collectors:
+            started = time.perf_counter()
+            try:
+                result = collector.collect(now)
+                if result is not None:
+                    data[collector.key] = result
+            except Exception as e:
+                print(f"采集器{collector.key}异常: {str(e)}")
+            timings[collector.key] = round((time.perf_counter() - started) * 1000, 3)
+        self.collect_timings = timings
+        return data
+
+    def on_canvas_draw(self, event):
+        # 整图重绘完成：缓存坐标区背景，并把曲线画回本次重绘的结果中
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.draw_lines()
+
+    def draw_lines(self):
+        # 用最新历史数据更新曲线并绘制到画布缓冲区
+        for key, line in self.lines.items():
+            values = self.history[key]
+            line.set_data(range(len(values)), values)
+            self.ax.draw_artist(line)
 
-        # 设置图表属性
-        self.ax.set_ylim(0, 100)
-        self.ax.set_xlabel('时间（秒）', color='white')
-        self.ax.set_ylabel('使用率 (%)', color='white')
-        self.ax.legend(facecolor='#1a1a1a', labelcolor='white')
-        self.canvas.draw()
+    def update_ui(self, data):
+        # 更新界面显示：恢复缓存的背景，只重画曲线并blit坐标区，不再重建整个图表
+        if self.background is None:
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self.background)
+            self.draw_lines()
+        self.canvas.blit(self.ax.bbox)
 
         # 更新数值显示
         self.status_vars['CPU'].set(f"{data['cpu']:.1f}%")
@@ -589,74 +1976,139 @@ class PerformanceMonitor:
         self.status_vars['磁盘'].set(f"{data['disk']:.1f}%")
         self.status_vars['上行'].set(f"{data['net_up']:.1f}KB/s")
         self.status_vars['下行'].set(f"{data['net_down']:.1f}KB/s")
-        if GPU_ENABLED:
+        if self.gpu_enabled:
             gpu_text = f"{data['gpu']:.1f}%" if data['gpu'] else "N/A"
             self.status_vars['GPU'].set(gpu_text)
 
-    def send_data(self):
-        # 执行监控和数据发送
-        if not self.running:
-            return
-
-        try:
-            # 获取并处理性能数据
-            data = self.get_performance()
-
-            # 更新历史记录
+    def update_history(self):
+        # 从环形缓冲区取出界面尚未处理的样本追加到历史记录，返回这些样本
+        self.ui_cursor, new_samples = self.samples.read_since(self.ui_cursor)
+        for data in new_samples:
             self.history['cpu'].append(data['cpu'])
             self.history['mem'].append(data['mem'])
             self.history['disk'].append(data['disk'])
             if data['gpu'] is not None:
                 self.history['gpu'].append(data['gpu'])
+        return new_samples
 
-            # 准备发送数据
-            payload = {
-                'name': self.config['sender']['computer_name'],
-                'data': data
-            }
-
-            # 启动发送线程
-            threading.Thread(
-                target=self.send_to_server,
-                args=(
-                    self.config['sender']['receiver_ip'],
-                    self.config.getint('sender', 'receiver_port'),
-                    json.dumps(payload).encode()
-                ),
-                daemon=True
-            ).start()
-
-            # 发送日志信息
-            log_msg = f"[{data['time']}] {payload['name']} - CPU:{data['cpu']}% MEM:{data['mem']}%"
-            threading.Thread(
-                target=self.send_to_server,
-                args=(
-                    self.config['sender']['log_server_ip'],
-                    self.config.getint('sender', 'log_server_port'),
-                    log_msg.encode()
-                ),
-                daemon=True
-            ).start()
-
-            # 更新界面
-            self.root.after(0, lambda: self.update_ui(data))
+    def refresh_ui(self):
+        # 界面刷新（Tk主线程）：更新历史记录；只有窗口可见时才重绘图表
+        if not self.running:
+            return
 
+        try:
+            new_samples = self.update_history()
+            if new_samples and self.ui_ready and self.window_visible:
+                self.update_ui(new_samples[-1])
         except Exception as e:
-            print(f"数据采集/发送异常: {str(e)}")
+            print(f"界面刷新异常: {str(e)}")
 
-        # 调度下一次执行
+        # 调度下一次刷新
         if self.running:
-            self.after_id = self.root.after(1000, self.send_data)
+            self.after_id = self.root.after(self.sample_interval, self.refresh_ui)
 
-    def send_to_server(self, ip, port, data):
-        # 网络发送方法
+    def send_data(self):
+        # 网络发送线程：读取新样本放入批量缓冲，满足条件时发送到接收端和日志服务器
+        cursor = 0
+        while self.running:
+            waits = [self.batcher.time_until_flush(), 1]
+            if self.aggregator is not None:
+                waits.append(self.aggregator.time_until_flush())
+            cursor, new_samples = self.samples.wait_since(cursor, timeout=min(w for w in waits if w is not None))
+            for data in new_samples:
+                if self.aggregator is not None:
+                    # 启用窗口聚合时，只有结束的窗口生成的聚合记录进入批量缓冲
+                    data = self.aggregator.add(data)
+                    if data is None:
+                        continue
+                self.batcher.add(data)
+                if self.batcher.ready():
+                    self.flush_batch()
+            if self.aggregator is not None and self.aggregator.ready():
+                self.batcher.add(self.aggregator.drain())
+            if self.batcher.ready():
+                self.flush_batch()
+
+    def flush_batch(self):
+        # 将批量缓冲中的样本合并成一帧发送；单个样本保持原有的data格式
+        batch = self.batcher.drain()
+        name = self.config['sender']['computer_name']
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(2)
-                s.connect((ip, port))
-                s.sendall(data)
+            # net_up/net_down是按采样间隔换算的KB/s速率（不是累计字节数），接收端据net_unit直接记录
+            frame_extra = {'agent': self.agent_stats(), 'net_unit': 'KB/s'}
+            now = time.monotonic()
+            if now - self.sched_stats_sent >= self.sched_stats_interval:
+                frame_extra['sched'] = self.scheduler.stats()
+                self.sched_stats_sent = now
+
+            started = time.perf_counter()
+            samples = batch
+            if self.wire_format != 'binary':
+                if self.delta is not None:
+                    # 任一接收端连接可能丢过数据时先发关键帧，避免接收端在旧基准上继续叠加差量
+                    gaps = sum(conn.gap_events() for conn in self.receiver_conns)
+                    if gaps != self.delta_gaps:
+                        self.delta.reset()
+                        self.delta_gaps = gaps
+                    samples = [self.delta.encode(data) for data in batch]
+            # log_via_receiver开启时日志只由第一个接收端转发：发给它的帧带log_via_receiver标记，
+            # 发给其他接收端的帧不带，避免同一样本被多个接收端重复转发
+            if self.log_conn is None:
+                first = self.encode_frame(name, samples, dict(frame_extra, log_via_receiver=True))
+                frame = self.encode_frame(name, samples, frame_extra) if len(self.receiver_conns) > 1 else first
+            else:
+                first = frame = self.encode_frame(name, samples, frame_extra)
+            self.serialize_ms = (time.perf_counter() - started) * 1000
+            # 同一份数据交给每个接收端的发送线程并发写出
+            for index, conn in enumerate(self.receiver_conns):
+                conn.send(first if index == 0 else frame)
+
+            # 发送日志信息，同一批次的日志合并为一次写入
+            if self.log_conn is not None:
+                log_msg = ''.join(
+                    f"[{data['time']}] {name} - CPU:{data['cpu']}% MEM:{data['mem']}%\n" for data in batch
+                )
+                self.log_conn.send(log_msg.encode())
         except Exception as e:
-            print(f"连接错误 ({ip}:{port}): {str(e)}")
+            print(f"数据发送异常: {str(e)}")
+
+    def encode_frame(self, name, samples, frame_extra):
+        # 按配置的传输格式把一批样本和帧级附加信息编码成一帧
+        if self.wire_format == 'binary':
+            return encode_samples(samples, frame_extra)
+        if len(samples) == 1:
+            payload = {'name': name, 'data': samples[0]}
+        else:
+            payload = {'name': name, 'samples': samples}
+        payload.update(frame_extra)
+        body = json.dumps(payload).encode()
+        if self.wire_format == 'framed':
+            return LENGTH_PREFIX.pack(len(body)) + body
+        # 每帧以换行结尾，便于在长连接上分帧
+        return body + b'\n'
+
+    def agent_stats(self):
+        # 发送端自身的开销：进程CPU（%，可超过100）和内存、各采集器耗时、上一帧的序列化耗时，
+        # 以及到接收端和日志服务器的发送延迟、失败次数和积压量。
+        # report_interval_ms为两帧之间的最长预期间隔（当前采样周期加上批量和窗口聚合的等待时间），
+        # 接收端据此判断设备是否离线
+        with self.agent_process.oneshot():
+            cpu = self.agent_process.cpu_percent(interval=None)
+            rss = self.agent_process.memory_info().rss
+        report_interval = self.scheduler.interval + self.batcher.max_delay
+        if self.aggregator is not None:
+            report_interval += self.aggregator.window
+        return {
+            'cpu': round(cpu, 1),
+            'rss_mb': round(rss / 1024 / 1024, 1),
+            'report_interval_ms': round(report_interval * 1000),
+            'collect_ms': self.collect_timings,
+            'serialize_ms': round(self.serialize_ms, 3),
+            'receivers': [
+                dict(conn.stats(), address=f'{conn.address[0]}:{conn.address[1]}') for conn in self.receiver_conns
+            ],
+            'log_server': self.log_conn.stats() if self.log_conn is not None else None
+        }
 
     def on_close(self):
         # 处理关闭事件
@@ -665,19 +2117,41 @@ class PerformanceMonitor:
                 "确定要退出程序吗？",
                 parent=self.root
         ):
-            self.running = False
+            self.stop_services()
             self.root.destroy()
             sys.exit(0)
 
     def start_monitoring(self):
-        # 启动监控循环
-        self.send_data()
-        self.root.mainloop()
+        # 启动采样线程、网络发送线程，以及界面刷新循环或无界面等待
+        self.engine.start()
+        threading.Thread(target=self.send_data, name="sender", daemon=True).start()
+        if self.headless:
+            self.run_headless()
+        else:
+            self.refresh_ui()
+            self.root.mainloop()
+
+    def run_headless(self):
+        # 无界面模式：主线程只等待退出信号（Ctrl+C或SIGTERM），退出前把已入队的数据发送或转存
+        stop_event = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+        print("无界面模式运行中，按Ctrl+C退出")
+        try:
+            while not stop_event.wait(1):
+                pass
+        except KeyboardInterrupt:
+            pass
+        self.stop_services(timeout=2)
 
 
 if __name__ == "__main__":
-    # Linux特定设置
-    if platform.system() == 'Linux':
+    parser = argparse.ArgumentParser(description="服务器性能监视软件发送端")
+    parser.add_argument('--headless', action='store_true',
+                        help='无界面模式：只运行采样和发送，不加载GUI和绘图模块')
+    args = parser.parse_args()
+
+    # Linux特定设置（仅图形界面需要）
+    if platform.system() == 'Linux' and not args.headless:
         # 禁用Gnome的加速抑制
         os.environ.pop('GTK_MODULES', None)
         # 确保XDG_RUNTIME_DIR存在
@@ -687,4 +2161,4 @@ if __name__ == "__main__":
         os.makedirs(os.environ['XDG_RUNTIME_DIR'], exist_ok=True)
 
     # 启动主程序
-    monitor = PerformanceMonitor()
\ No newline at end of file
+    monitor = PerformanceMonitor(headless=args.headless)
\ No newline at end of file
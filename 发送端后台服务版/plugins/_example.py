@@ -0,0 +1,14 @@
+# 插件示例（以_开头的文件不会被加载；复制为不带下划线的文件名即可启用）
+# 插件放在config.ini中plugin_dir指定的目录下，每个插件是一个定义了collect()函数的.py文件。
+# collect()的返回值需可JSON序列化，发送端以插件名为key放在样本的plugins字段中。
+# collect()在插件自己的工作线程中执行，可以阻塞（如访问数据库），但超过TIMEOUT_MS时本次结果记为超时。
+import os
+
+NAME = 'example'    # 可选，默认为文件名
+TIMEOUT_MS = 1000   # 可选，默认为config.ini中的plugin_timeout
+
+
+def collect():
+    # 示例：统计某个队列目录中待处理的文件数
+    queue_dir = '/var/spool/myapp'
+    return {'queue_depth': len(os.listdir(queue_dir)) if os.path.isdir(queue_dir) else 0}
@@ -2,15 +2,22 @@ import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox  # 兼容性导入
 import socket
+import asyncio
+import queue
 import json
+import struct
 import threading
 import time
-from collections import deque
+from datetime import datetime
+from collections import OrderedDict
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import matplotlib.pyplot as plt
 import configparser
 import platform
+import os
+import hashlib
+import numpy as np  # 设备历史的环形缓冲区
 from matplotlib import font_manager  # 修复导入问题
 
 
@@ -26,6 +33,63 @@ def get_system_fonts():
     return sorted(fonts)
 
 
+def get_font_cache_path():
+    """字体缓存文件路径，三个程序共用同一份缓存"""
+    if platform.system() == 'Windows':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    elif platform.system() == 'Darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'perfmon', 'font_cache.json')
+
+
+def get_font_dirs_signature():
+    """系统字体目录（含子目录）修改时间的摘要，安装或删除字体后随之变化，用于判断缓存是否失效"""
+    font_dirs = list(getattr(font_manager, 'X11FontDirectories', []))
+    font_dirs += getattr(font_manager, 'OSXFontDirectories', [])
+    font_dirs += getattr(font_manager, 'MSUserFontDirectories', [])
+    if platform.system() == 'Windows':
+        font_dirs.append(font_manager.win32FontDirectory())
+
+    digest = hashlib.sha1()
+    for font_dir in sorted(set(font_dirs)):
+        if not os.path.isdir(font_dir):
+            continue
+        for path, subdirs, _ in os.walk(font_dir):
+            subdirs.sort()
+            try:
+                digest.update(f"{path}:{os.stat(path).st_mtime_ns}\n".encode('utf-8', errors='replace'))
+            except OSError:
+                pass
+    return digest.hexdigest()
+
+
+def load_font_cache():
+    """读取字体缓存，文件不存在或损坏时返回空字典"""
+    try:
+        with open(get_font_cache_path(), encoding='utf-8') as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_font_cache(key, signature, font):
+    """写入字体缓存（先写临时文件再替换，避免多个程序同时启动时读到半个文件）"""
+    path = get_font_cache_path()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        cache = load_font_cache()
+        cache[key] = {'signature': signature, 'font': font}
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"写入字体缓存失败: {e}")
+
+
 def find_chinese_font():
     """寻找可用的中文字体"""
     # 根据系统设置候选字体列表
@@ -50,64 +114,511 @@ def find_chinese_font():
     # 添加通用字体
     candidates += ['sans-serif', 'Arial', 'Helvetica']
 
-    # 查找系统中实际存在的字体
+    # 字体目录未变化时直接使用磁盘缓存的结果，避免每次启动都扫描全部字体
+    cache_key = '|'.join(candidates)
+    signature = get_font_dirs_signature()
+    cached = load_font_cache().get(cache_key)
+    if isinstance(cached, dict) and cached.get('signature') == signature:
+        return cached['font']
+
+    # 查找系统中实际存在的字体；如果都没有，使用第一个备选字体
     system_fonts = get_system_fonts()
+    chosen = candidates[0] if candidates else 'sans-serif'
     for font in candidates:
         if font in system_fonts:
-            return font
+            chosen = font
+            break
 
-    # 如果都没有，返回第一个备选字体
-    return candidates[0] if candidates else 'sans-serif'
+    save_font_cache(cache_key, signature, chosen)
+    return chosen
 
 
 # ===== 结束字体选择函数 =====
 
+# ===== 传输协议（与发送端保持一致） =====
+# 每个连接按开头的4个字节协商协议：WIRE_MAGIC为二进制协议，FRAMED_JSON_MAGIC为长度前缀的JSON，
+# 否则为换行分隔的JSON。二进制协议每帧为定长帧头（消息类型、协议版本、样本数、帧体长度）加帧体，
+# 主机名只在HELLO帧中出现一次；长度前缀的JSON每帧为4字节帧体长度（网络字节序）加一条JSON消息。
+WIRE_MAGIC = b'\x00PMB'
+WIRE_VERSION = 1
+MSG_HELLO = 1
+MSG_SAMPLES = 2
+MSG_EXT = 3  # 紧接其后的SAMPLES帧的扩展字段（JSON）：帧级信息frame和逐样本的附加字段samples
+FRAME_HEADER = struct.Struct('!BBHI')
+SAMPLE_STRUCT = struct.Struct('!dffffff')  # 时间戳、CPU、内存、磁盘、上行、下行、GPU（NaN表示无）
+SAMPLE_FIELDS = ('time', 'cpu', 'mem', 'disk', 'net_up', 'net_down', 'gpu')
+NUMERIC_FIELDS = ('cpu', 'mem', 'disk', 'net_up', 'net_down')  # 写入设备历史的数值字段
+# 帧级选项：作用于帧内的每个样本，不作为统计信息记录。
+# net_unit为'KB/s'时net_up/net_down是发送端换算好的速率，否则是累计字节数；
+# log_via_receiver表示发送端开启了经接收端转发日志（且选定本接收端转发），只有这些样本的日志被转发
+FRAME_OPTIONS = ('net_unit', 'log_via_receiver')
+FRAMED_JSON_MAGIC = b'\x00PMJ'
+LENGTH_PREFIX = struct.Struct('!I')
+
+class LogForwarder:
+    # 把发送端的日志记录批量转发到日志服务器（发送端配置log_via_receiver = true时只连接接收端）。
+    # 记录先放入有界队列（满时丢弃最旧的），由单个线程攒够max_lines条或等待max_delay_ms毫秒后
+    # 合并为一次写入；使用一个长连接，连接或写入失败后按指数退避重连，日志服务器不可用时不会拖慢接收端。
+    # 与发送端的ConnectionManager相同，连接保持stable_after秒以上后断开才从backoff_min重新退避。
+    def __init__(self, ip, port, max_lines=100, max_delay_ms=1000, max_queue=10000, timeout=2, stable_after=5):
+        self.address = (ip, port)
+        self.max_lines = max(1, max_lines)
+        self.max_delay = max_delay_ms / 1000
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.backoff_min = 0.5
+        self.backoff_max = 30
+        self.stable_after = stable_after
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._sock = None
+        self._backoff = self.backoff_min
+        self._next_attempt = 0.0
+        self._connected_at = 0.0
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="log-forwarder", daemon=True)
+        self._thread.start()
+
+    def send(self, line):
+        # 放入一条日志记录（bytes，以换行结尾），队列满时丢弃最旧的一条
+        while True:
+            try:
+                self._queue.put_nowait(line)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def close(self):
+        self._stop_event.set()
+
+    def _run(self):
+        batch = []
+        deadline = 0.0
+        while not self._stop_event.is_set():
+            timeout = min(1.0, max(0.0, deadline - time.monotonic())) if batch else 1
+            try:
+                line = self._queue.get(timeout=timeout)
+                if not batch:
+                    deadline = time.monotonic() + self.max_delay
+                batch.append(line)
+            except queue.Empty:
+                pass
+
+            now = time.monotonic()
+            if batch and (len(batch) >= self.max_lines or now >= deadline) and now >= self._next_attempt:
+                if self._write(b''.join(batch)):
+                    batch = []
+                else:
+                    # 发送失败时保留本批记录等待重连，超出队列上限的部分丢弃最旧的
+                    del batch[:-self.max_queue]
+                    deadline = self._next_attempt
+        if batch:
+            self._write(b''.join(batch))
+        self._disconnect()
+
+    def _write(self, data):
+        if self._sock is None:
+            try:
+                self._sock = socket.create_connection(self.address, timeout=self.timeout)
+                self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            except OSError as e:
+                print(f"连接日志服务器失败: {str(e)}")
+                self._sock = None
+                self._next_attempt = time.monotonic() + self._backoff
+                self._backoff = min(self._backoff * 2, self.backoff_max)
+                return False
+            self._connected_at = time.monotonic()
+        try:
+            self._sock.sendall(data)
+        except OSError as e:
+            print(f"转发日志失败: {str(e)}")
+            self._disconnect()
+            return False
+        return True
+
+    def _disconnect(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+            now = time.monotonic()
+            if now - self._connected_at >= self.stable_after:
+                self._backoff = self.backoff_min
+            self._next_attempt = now + self._backoff
+            self._backoff = min(self._backoff * 2, self.backoff_max)
+
+
+HISTORY_FIELDS = ('cpu', 'cpu_peak', 'mem', 'disk', 'net_up', 'net_down')
+ROLLUP_STATS = ('min', 'max', 'avg')
+DEFAULT_RETENTION = '1s:1h, 1m:7d, 1h:365d'
+# 界面可选的时间范围（秒），None表示实时显示最近的原始样本
+TIME_RANGES = {'实时': None, '1小时': 3600, '24小时': 86400, '7天': 7 * 86400, '30天': 30 * 86400, '1年': 365 * 86400}
+
+
+def parse_duration(text):
+    # '1s'、'5m'、'1h'、'7d'形式的时长转换为秒，不带单位时按秒计
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    text = text.strip().lower()
+    if text and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+
+def parse_retention(value):
+    # 长期保存的分级配置：逗号分隔的"分辨率:保存时长"，如'1s:1h, 1m:7d, 1h:365d'
+    tiers = []
+    for item in value.split(','):
+        if item.strip():
+            resolution, retention = item.split(':')
+            tiers.append((parse_duration(resolution), parse_duration(retention)))
+    if not tiers or any(resolution <= 0 or retention < resolution for resolution, retention in tiers):
+        raise ValueError(value)
+    return sorted(tiers)
+
+
+class HistoryRing:
+    # 设备实时历史：NumPy环形缓冲区，每个指标一列，采集时间单独一列。
+    # 数组从CHUNK条开始按需成倍增长，只为实际保存的记录分配内存；写满capacity条后改为双写：
+    # 每条记录同时写入i和i+capacity两处，最近capacity条记录在数组中始终连续，
+    # 每秒刷新的实时图表和窗口统计直接取数组视图，不需要拷贝或拼接
+    CHUNK = 64
+
+    def __init__(self, capacity=60, fields=HISTORY_FIELDS):
+        self.capacity = capacity
+        self.columns = {name: i for i, name in enumerate(fields)}
+        size = min(capacity, self.CHUNK)
+        self.times = np.zeros(size)
+        self.values = np.zeros((size, len(fields)), dtype=np.float32)
+        self.wrapped = False  # 是否已写满并改为双写
+        self.pos = 0          # 下一条记录的写入位置（双写前等于记录数）
+        self.count = 0
+
+    @staticmethod
+    def max_bytes(capacity, columns):
+        # 写满后（双写）占用的内存字节数
+        return 2 * capacity * (8 + 4 * columns)
+
+    def _reserve(self):
+        # 保证pos处可以写入：双写前数组已满时成倍扩大，达到capacity后改为双写
+        if self.wrapped or self.pos < len(self.times):
+            return
+        size = min(2 * len(self.times), self.capacity) if len(self.times) < self.capacity else 2 * self.capacity
+        times = np.zeros(size)
+        values = np.zeros((size, self.values.shape[1]), dtype=np.float32)
+        times[:self.pos] = self.times[:self.pos]
+        values[:self.pos] = self.values[:self.pos]
+        if size == 2 * self.capacity:
+            times[self.capacity:] = times[:self.capacity]
+            values[self.capacity:] = values[:self.capacity]
+            self.pos = 0
+            self.wrapped = True
+        self.times, self.values = times, values
+
+    def append(self, timestamp, row):
+        self._reserve()
+        if self.wrapped:
+            for i in (self.pos, self.pos + self.capacity):
+                self.times[i] = timestamp
+                self.values[i] = row
+            self.pos = (self.pos + 1) % self.capacity
+        else:
+            self.times[self.pos] = timestamp
+            self.values[self.pos] = row
+            self.pos += 1
+        self.count = min(self.count + 1, self.capacity)
+
+    def window(self, n=None, since=None):
+        # 最近n条（或since之后）记录的(采集时间, 指标)视图，按时间先后排列
+        n = self.count if n is None else min(n, self.count)
+        end = self.pos + self.capacity if self.wrapped else self.pos
+        times, values = self.times[end - n:end], self.values[end - n:end]
+        if since is not None:
+            start = np.searchsorted(times, since)
+            times, values = times[start:], values[start:]
+        return times, values
+
+    def column(self, name, n=None, since=None):
+        return self.window(n, since)[1][:, self.columns[name]]
+
+
+class RollupRing:
+    # 降采样记录的环形缓冲区：数组同样按需成倍增长到capacity条，但每条记录只写一份。
+    # 降采样记录只在查看长时间范围时读取，读取时按时间先后拷贝拼接，不为零拷贝读取双写
+    CHUNK = HistoryRing.CHUNK
+
+    def __init__(self, capacity, columns):
+        self.capacity = capacity
+        size = min(capacity, self.CHUNK)
+        self.times = np.zeros(size)
+        self.values = np.zeros((size, columns), dtype=np.float32)
+        self.pos = 0    # 下一条记录的写入位置
+        self.count = 0
+
+    @staticmethod
+    def max_bytes(capacity, columns):
+        # 写满后占用的内存字节数
+        return capacity * (8 + 4 * columns)
+
+    def append(self, timestamp, row):
+        if self.pos == len(self.times) < self.capacity:
+            size = min(2 * len(self.times), self.capacity)
+            times = np.zeros(size)
+            values = np.zeros((size, self.values.shape[1]), dtype=np.float32)
+            times[:self.pos] = self.times
+            values[:self.pos] = self.values
+            self.times, self.values = times, values
+        self.times[self.pos] = timestamp
+        self.values[self.pos] = row
+        self.pos = (self.pos + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def replace_last(self, timestamp, row):
+        # 原地更新最新的一条记录
+        last = (self.pos - 1) % self.capacity
+        self.times[last] = timestamp
+        self.values[last] = row
+
+    def window(self):
+        # 全部记录的(时间, 各列)，按时间先后排列；写满后最早的记录从pos开始，拼接为新数组
+        if self.count < self.capacity:
+            return self.times[:self.count], self.values[:self.count]
+        return (np.concatenate((self.times[self.pos:], self.times[:self.pos])),
+                np.concatenate((self.values[self.pos:], self.values[:self.pos])))
+
+
+class RollupTier:
+    # 一级降采样：样本按resolution归入时间桶，桶内各指标的min/max/avg随每个样本更新，
+    # 下一个桶开始或设备离线（close）时写入环形缓冲区；未结束的桶只保存在累加值中，读取时附在最后。
+    # 离线后同一时间桶又收到样本（短暂断线）时原地更新已写入的记录，不会产生重复的时间桶
+    def __init__(self, resolution, retention, fields=HISTORY_FIELDS):
+        self.resolution = resolution
+        self.retention = retention
+        self.stats = self.tier_stats(resolution)
+        self.columns = {f'{name}_{stat}': i for i, (stat, name) in
+                        enumerate((stat, name) for stat in self.stats for name in fields)}
+        self.ring = RollupRing(max(1, int(retention / resolution)), len(self.columns))
+        self.bucket = None  # 当前时间桶的起点
+        self.count = 0
+        self.committed = False  # 当前时间桶是否已写入环形缓冲区
+        self.low = np.zeros(len(fields))
+        self.high = np.zeros(len(fields))
+        self.total = np.zeros(len(fields))
+
+    @staticmethod
+    def tier_stats(resolution):
+        # 1秒及更细的一级每个桶通常只有一个样本，min/max与平均值相同，只保存平均值
+        return ROLLUP_STATS if resolution > 1 else ('avg',)
+
+    def add(self, timestamp, row):
+        bucket = timestamp - timestamp % self.resolution
+        # 采集时间回退（发送端校时等）的样本计入当前桶
+        if self.bucket is None or bucket > self.bucket:
+            self.close()
+            self.bucket = bucket
+            self.count = 0
+            self.committed = False
+        if self.count:
+            np.minimum(self.low, row, out=self.low)
+            np.maximum(self.high, row, out=self.high)
+            self.total += row
+        else:
+            self.low[:] = self.high[:] = self.total[:] = row
+        self.count += 1
+        if self.committed:
+            self.ring.replace_last(self.bucket, self.record())
+
+    def record(self):
+        stats = {'min': self.low, 'max': self.high, 'avg': self.total / self.count}
+        return np.concatenate([stats[stat] for stat in self.stats])
+
+    def close(self):
+        # 结束当前时间桶，写入环形缓冲区
+        if self.count and not self.committed:
+            self.ring.append(self.bucket, self.record())
+            self.committed = True
+
+    def window(self, since=None):
+        # since之后的(时间桶起点, 各列)，按时间先后排列，包括未结束的当前时间桶
+        times, values = self.ring.window()
+        if self.count and not self.committed:
+            times = np.append(times, self.bucket)
+            values = np.vstack((values, self.record()))
+        if since is not None:
+            start = np.searchsorted(times, since)
+            times, values = times[start:], values[start:]
+        return times, values
+
+    def index(self, name, stat):
+        # 指标某统计量在window()结果中的列号，该级未保存的统计量（1秒级的min/max）取平均值
+        return self.columns.get(f'{name}_{stat}', self.columns[f'{name}_avg'])
+
+
+class TieredHistory:
+    # RRD式的分级长期保存：每级按各自的分辨率和保存时长保存min/max/avg，
+    # 每个样本到达时增量更新各级的当前时间桶，不保存全部原始样本。
+    # 各级数组随数据成倍增长，写满保存时长后每台设备的占用为max_bytes(tiers)
+    # （默认配置约1.6MB），max_devices应按此和可用内存设置
+    def __init__(self, tiers):
+        self.tiers = [RollupTier(resolution, retention) for resolution, retention in tiers]
+
+    @staticmethod
+    def max_bytes(tiers, fields=HISTORY_FIELDS):
+        return sum(
+            RollupRing.max_bytes(max(1, int(retention / resolution)),
+                                 len(RollupTier.tier_stats(resolution)) * len(fields))
+            for resolution, retention in tiers
+        )
+
+    def append(self, timestamp, row):
+        for tier in self.tiers:
+            tier.add(timestamp, row)
+
+    def close(self):
+        # 设备离线：结束各级当前的时间桶
+        for tier in self.tiers:
+            tier.close()
+
+    def select(self, span):
+        # 能覆盖所查时间范围的最细一级，都不够时取保存最久的一级
+        for tier in self.tiers:
+            if tier.retention >= span:
+                return tier
+        return max(self.tiers, key=lambda tier: tier.retention)
+
+
 class EnhancedDeviceManager:
-    def __init__(self, max_devices=5):
-        self.active_devices = deque(maxlen=max_devices)
-        self.device_lock = threading.Lock()
+    # 设备注册表：按设备ID（主机名@IP，同一出口IP后的多台主机互不覆盖）索引，查找为O(1)。
+    # 设备按最近一次收到数据的先后排列；达到容量上限时淘汰最久未更新的离线设备，
+    # 所有设备都在线时不淘汰，新设备被拒绝并提示调大max_devices。
+    def __init__(self, max_devices=5000, history_size=60, retention=None):
+        self.devices = OrderedDict()  # 设备ID -> 设备，最近更新的在末尾
+        self.max_devices = max_devices
+        self.history_size = history_size
+        self.retention = retention or parse_retention(DEFAULT_RETENTION)
+        self.device_lock = threading.RLock()
         self.current_index = 0
         self.last_switch = time.time()
         self.heartbeat_timeout = 10
+        self.last_samples = {}  # 设备ID -> 最近一次还原后的完整样本，用于还原差量编码的样本
+        self.last_seq = {}      # 设备ID -> 最近一次样本的序号（发送端差量编码的seq）
+        self.rejected = 0       # 因容量已满且没有可淘汰的离线设备而拒绝的样本数
+
+    @staticmethod
+    def device_id(ip, name):
+        return f"{name}@{ip}"
+
+    def is_online(self, device, now=None):
+        # 发送端上报了两帧之间的预期间隔时（自适应采样放慢、批量或窗口聚合），超时取该间隔的3倍，
+        # 不低于heartbeat_timeout，避免按正常间隔发送的设备被判为离线（并因此被淘汰）
+        timeout = self.heartbeat_timeout
+        agent = device['stats'].get('agent')
+        if isinstance(agent, dict) and isinstance(agent.get('report_interval_ms'), (int, float)):
+            timeout = max(timeout, 3 * agent['report_interval_ms'] / 1000)
+        return ((now or time.time()) - device['last_seen']) < timeout
+
+    def evict(self):
+        # 淘汰最久未更新的离线设备，返回是否腾出了位置
+        device_id, device = next(iter(self.devices.items()))
+        if self.is_online(device):
+            return False
+        del self.devices[device_id]
+        self.last_samples.pop(device_id, None)
+        self.last_seq.pop(device_id, None)
+        return True
+
+    def expand_sample(self, device_id, data):
+        # 差量编码：不带delta标记的样本（关键帧或未启用差量编码）整体保存；
+        # 带delta标记的样本只含变化的字段，其余字段沿用该设备上一次的值。
+        # 尚未收到关键帧的设备（如接收端刚启动）的差量样本无法还原，返回None。
+        # 样本带seq时检查连续性：中间有样本丢失（发送端队列丢弃、断线等）则基准已不可靠，
+        # 丢弃之后的差量样本直到下一个关键帧
+        with self.device_lock:
+            seq = data.pop('seq', None)
+            if not data.get('delta'):
+                self.last_samples[device_id] = dict(data)
+                self.last_seq[device_id] = seq
+                return data
+            base = self.last_samples.get(device_id)
+            if base is None:
+                return None
+            last_seq = self.last_seq.get(device_id)
+            if seq is not None and last_seq is not None and seq != last_seq + 1:
+                print(f"设备 {device_id} 的差量样本不连续（{last_seq} -> {seq}），等待下一个关键帧")
+                del self.last_samples[device_id]
+                return None
+            self.last_seq[device_id] = seq
+            for key, value in data.items():
+                if key == 'delta':
+                    continue
+                if value is None and key not in SAMPLE_FIELDS:
+                    base.pop(key, None)
+                else:
+                    base[key] = value
+            return dict(base)
 
     def update_device(self, device_data):
         with self.device_lock:
-            ip = device_data['ip']
-            existing = next((d for d in self.active_devices if d['ip'] == ip), None)
+            device_id = self.device_id(device_data['ip'], device_data['name'])
+            # 批量帧中的样本同时到达，速率按样本自身的采集时间计算
+            sample_time = device_data.get('sample_time') or time.time()
+            # 发送端附带的统计信息（调度抖动、采集耗时等），只保留每项的最新值
+            stats = device_data.pop('stats', None) or {}
+            # 发送端开启窗口聚合时，每条记录附带窗口内各指标的min/max/avg，CPU峰值单独记录历史
+            agg = stats.pop('agg', None)
+            cpu_peak = agg['cpu']['max'] if agg and 'cpu' in agg else device_data['cpu']
+            # 发送端已换算为速率时直接记录，累计字节数按与上一个样本的差值换算为KB/s
+            net_rate = device_data.pop('net_rate', False)
+            existing = self.devices.get(device_id)
             if existing:
-                existing['name'] = device_data.get('name', existing['name'])
+                self.devices.move_to_end(device_id)
+                existing['stats'].update(stats)
+                existing['agg'] = agg
                 existing['last_seen'] = time.time()
-                existing['data']['cpu_history'].append(device_data['cpu'])
-                existing['data']['mem_history'].append(device_data['mem'])
-                existing['data']['disk_history'].append(device_data['disk'])
 
-                time_diff = time.time() - existing['last_net_time']
+                time_diff = sample_time - existing['last_net_time']
                 net_up_diff = device_data['net_up'] - existing['last_net_up']
                 net_down_diff = device_data['net_down'] - existing['last_net_down']
 
-                if time_diff > 0:
-                    existing['data']['net_up_history'].append(net_up_diff / time_diff / 1024)
-                    existing['data']['net_down_history'].append(net_down_diff / time_diff / 1024)
+                if net_rate:
+                    net_up_rate, net_down_rate = device_data['net_up'], device_data['net_down']
+                elif time_diff > 0:
+                    net_up_rate = net_up_diff / time_diff / 1024
+                    net_down_rate = net_down_diff / time_diff / 1024
                 else:
-                    existing['data']['net_up_history'].append(0)
-                    existing['data']['net_down_history'].append(0)
+                    net_up_rate = net_down_rate = 0
+                row = (device_data['cpu'], cpu_peak, device_data['mem'], device_data['disk'],
+                       net_up_rate, net_down_rate)
+                existing['history'].append(sample_time, row)
+                existing['archive'].append(sample_time, row)
 
                 existing['last_net_up'] = device_data['net_up']
                 existing['last_net_down'] = device_data['net_down']
-                existing['last_net_time'] = time.time()
+                existing['last_net_time'] = sample_time
             else:
+                if len(self.devices) >= self.max_devices and not self.evict():
+                    if self.rejected % 1000 == 0:
+                        print(f"设备数已达上限{self.max_devices}且均在线，忽略新设备 {device_id}")
+                    self.rejected += 1
+                    return
+                device_data['id'] = device_id
                 device_data['last_seen'] = time.time()
-                device_data['data'] = {
-                    'cpu_history': deque([device_data['cpu']], maxlen=60),
-                    'mem_history': deque([device_data['mem']], maxlen=60),
-                    'disk_history': deque([device_data['disk']], maxlen=60),
-                    'net_up_history': deque([0], maxlen=60),
-                    'net_down_history': deque([0], maxlen=60)
-                }
+                device_data['stats'] = stats
+                device_data['agg'] = agg
+                row = (device_data['cpu'], cpu_peak, device_data['mem'], device_data['disk'],
+                       *((device_data['net_up'], device_data['net_down']) if net_rate else (0, 0)))
+                device_data['history'] = HistoryRing(self.history_size)
+                device_data['history'].append(sample_time, row)
+                device_data['archive'] = TieredHistory(self.retention)
+                device_data['archive'].append(sample_time, row)
                 device_data['last_net_up'] = device_data['net_up']
                 device_data['last_net_down'] = device_data['net_down']
-                device_data['last_net_time'] = time.time()
-                self.active_devices.append(device_data)
+                device_data['last_net_time'] = sample_time
+                self.devices[device_id] = device_data
 
 
 class ReceiverPro(tk.Tk):
@@ -159,6 +670,7 @@ class ReceiverPro(tk.Tk):
         # 初始化配置
         self.config = configparser.ConfigParser()
         self.auto_switch_interval = 30
+        self.auto_switch_job = None  # 自动轮巡的after定时任务
         self.load_config()
 
         # 初始化主题样式
@@ -167,7 +679,31 @@ class ReceiverPro(tk.Tk):
         self._configure_styles()
 
         # 设备管理
-        self.dev_mgr = EnhancedDeviceManager()
+        try:
+            retention = parse_retention(self.config.get('Settings', 'retention', fallback=DEFAULT_RETENTION))
+        except ValueError:
+            print(f"retention配置无效，使用默认值 {DEFAULT_RETENTION}")
+            retention = parse_retention(DEFAULT_RETENTION)
+        self.dev_mgr = EnhancedDeviceManager(
+            self.config.getint('Settings', 'max_devices', fallback=5000),
+            self.config.getint('Settings', 'history_size', fallback=60),
+            retention
+        )
+        device_mb = TieredHistory.max_bytes(retention) / 1024 / 1024
+        print(f"长期保存每台设备最多占用约{device_mb:.1f}MB，"
+              f"{self.dev_mgr.max_devices}台设备最多约{device_mb * self.dev_mgr.max_devices / 1024:.1f}GB")
+        self.device_ids = []  # 设备下拉框中各项对应的设备ID
+        self.time_range = None  # 图表显示的时间范围（秒），None为实时
+
+        # 日志转发：forward_logs开启时，收到的样本由接收端批量转发到日志服务器
+        self.log_forwarder = None
+        if self.config.getboolean('Settings', 'forward_logs', fallback=False):
+            self.log_forwarder = LogForwarder(
+                self.config.get('Settings', 'log_server_ip', fallback='127.0.0.1'),
+                self.config.getint('Settings', 'log_server_port', fallback=54321),
+                max_lines=self.config.getint('Settings', 'forward_batch', fallback=100),
+                max_delay_ms=self.config.getint('Settings', 'forward_interval', fallback=1000)
+            )
         self.current_device = None
 
         # UI初始化
@@ -178,6 +714,8 @@ class ReceiverPro(tk.Tk):
     # 新增关闭确认方法
     def on_close(self):
         if messagebox.askyesno("退出", "确定要退出程序吗？", icon='question'):
+            if self.log_forwarder is not None:
+                self.log_forwarder.close()
             self.destroy()
 
     def _configure_styles(self):
@@ -235,6 +773,18 @@ class ReceiverPro(tk.Tk):
         self.device_selector.pack(pady=10)
         self.device_selector.bind('<<ComboboxSelected>>', self.select_device)
 
+        # 时间范围：实时显示最近的原始样本，更长的范围从对应分辨率的长期保存中读取
+        self.range_selector = ttk.Combobox(
+            control_frame,
+            font=self.tk_font,
+            width=25,
+            state='readonly',
+            values=list(TIME_RANGES)
+        )
+        self.range_selector.current(0)
+        self.range_selector.pack(pady=5)
+        self.range_selector.bind('<<ComboboxSelected>>', self.select_time_range)
+
         self.auto_toggle = tk.BooleanVar()
         self.auto_toggle_label = tk.StringVar()
         self.auto_toggle_label.set(f"自动轮巡（{self.auto_switch_interval}秒）")
@@ -280,6 +830,30 @@ class ReceiverPro(tk.Tk):
         self.time_scale.set(self.auto_switch_interval)
         self.time_scale.pack(side=tk.LEFT)
 
+        # 接收服务自身的状态：连接数、待处理样本、队列满丢弃和处理出错的样本数
+        self.ingest_var = tk.StringVar(value="接收服务: 未启动")
+        tk.Label(
+            control_frame,
+            textvariable=self.ingest_var,
+            bg='#0a0a0a',
+            fg='#aaaaaa',
+            font=self.tk_font,
+            justify=tk.LEFT,
+            anchor='w'
+        ).pack(pady=5, fill=tk.X)
+
+        # 当前设备发送端自身的开销（发送端随每一帧上报的agent统计）
+        self.agent_var = tk.StringVar(value="发送端开销: 无数据")
+        tk.Label(
+            control_frame,
+            textvariable=self.agent_var,
+            bg='#0a0a0a',
+            fg='#aaaaaa',
+            font=self.tk_font,
+            justify=tk.LEFT,
+            anchor='w'
+        ).pack(pady=15, fill=tk.X)
+
         self.figure = Figure(figsize=(11, 7), facecolor='#0a0a0a')
         self.ax_cpu = self.figure.add_subplot(311)
         self.ax_mem = self.figure.add_subplot(312)
@@ -332,54 +906,97 @@ class ReceiverPro(tk.Tk):
     def refresh_ui(self):
         device_list = []
         current_time = time.time()
+        any_online = False
         with self.dev_mgr.device_lock:
-            for dev in self.dev_mgr.active_devices:
-                status = '在线' if (current_time - dev['last_seen']) < self.dev_mgr.heartbeat_timeout else '离线'
-                device_list.append(f"{dev['name']} ({dev['ip']}) - {status}")
-
-        if self.device_selector['values'] != device_list:
+            devices = sorted(self.dev_mgr.devices.values(), key=lambda dev: (dev['name'], dev['ip']))
+            self.device_ids = [dev['id'] for dev in devices]
+            for dev in devices:
+                online = self.dev_mgr.is_online(dev, current_time)
+                any_online = any_online or online
+                if not online:
+                    dev['archive'].close()
+                device_list.append(f"{dev['name']} ({dev['ip']}) - {'在线' if online else '离线'}")
+
+        if list(self.device_selector['values']) != device_list:
             self.device_selector['values'] = device_list
 
         # 更新状态指示灯
-        led_color = '#00ff00' if any(
-            (current_time - dev['last_seen']) < self.dev_mgr.heartbeat_timeout
-            for dev in self.dev_mgr.active_devices
-        ) else '#ff0000'
+        led_color = '#00ff00' if any_online else '#ff0000'
         self.status_indicator.itemconfig(self.led, fill=led_color)
+        self.ingest_var.set(
+            f"接收服务\n连接: {self.active_connections}  待处理: {self.ingest_queue.qsize()}\n"
+            f"丢弃: {self.ingest_dropped}  出错: {self.ingest_errors}"
+        )
 
         # 更新图表
         if self.current_device:
             self.update_charts(self.current_device)
+            self.agent_var.set(self.format_agent_stats(self.current_device['stats'].get('agent')))
 
         self.after(1000, self.refresh_ui)
 
+    @staticmethod
+    def format_agent_stats(agent):
+        # 发送端开销的显示文本：进程CPU和内存、采集耗时（及最慢的采集器）、序列化耗时、发送延迟、失败次数和积压
+        if not agent:
+            return "发送端开销: 无数据"
+        lines = [
+            "发送端开销",
+            f"CPU: {agent.get('cpu', 0):.1f}%  内存: {agent.get('rss_mb', 0):.1f}MB"
+        ]
+        timings = agent.get('collect_ms') or {}
+        if timings:
+            slowest = max(timings, key=timings.get)
+            lines.append(f"采集: {sum(timings.values()):.1f}ms（{slowest} {timings[slowest]:.1f}ms）")
+        lines.append(f"序列化: {agent.get('serialize_ms', 0):.2f}ms")
+        # 旧版发送端只有一个接收端（receiver），新版为接收端列表（receivers）
+        links = [('接收端', agent.get('receiver'))]
+        links += [(f"接收端 {conn.get('address', '')}", conn) for conn in agent.get('receivers') or []]
+        links.append(('日志', agent.get('log_server')))
+        for title, conn in links:
+            if not conn:
+                continue
+            latency = conn.get('latency_ms')
+            latency_text = f"{latency:.1f}ms" if latency is not None else "N/A"
+            lines.append(
+                f"{title}: 延迟 {latency_text}  失败 {conn.get('failures', 0)}/{conn.get('connect_failures', 0)}"
+            )
+            lines.append(f"  积压 {conn.get('queue', 0)}条 / {conn.get('spool_bytes', 0) // 1024}KB  丢弃 {conn.get('dropped', 0)}")
+        return '\n'.join(lines)
+
     def select_device(self, event):
-        selected = self.device_selector.get()
-        if '(' in selected and ')' in selected:
-            ip = selected.split('(')[1].split(')')[0]
-            self.switch_to_device(ip)
+        index = self.device_selector.current()
+        if 0 <= index < len(self.device_ids):
+            self.switch_to_device(self.device_ids[index])
+
+    def select_time_range(self, event):
+        self.time_range = TIME_RANGES[self.range_selector.get()]
+        if self.current_device:
+            self.update_charts(self.current_device)
 
     def toggle_auto_switch(self):
-        if self.auto_toggle.get():
-            threading.Thread(target=self.auto_switch_task, daemon=True).start()
+        # 自动轮巡用after在Tk线程中每秒检查一次：切换设备要重绘图表，Tk和matplotlib不能在其他线程中调用
+        if self.auto_toggle.get() and self.auto_switch_job is None:
+            self.auto_switch_job = self.after(1000, self.auto_switch_task)
 
     def auto_switch_task(self):
-        while self.auto_toggle.get():
-            if time.time() - self.dev_mgr.last_switch > self.auto_switch_interval:
-                with self.dev_mgr.device_lock:
-                    if self.dev_mgr.active_devices:
-                        self.dev_mgr.current_index = (self.dev_mgr.current_index + 1) % len(self.dev_mgr.active_devices)
-                        target = self.dev_mgr.active_devices[self.dev_mgr.current_index]
-                        self.switch_to_device(target['ip'])
-                        self.dev_mgr.last_switch = time.time()
-            time.sleep(1)
-
-    def switch_to_device(self, target_ip):
+        self.auto_switch_job = None
+        if not self.auto_toggle.get():
+            return
+        # device_ids只在Tk线程中由refresh_ui更新，不需要加锁
+        if time.time() - self.dev_mgr.last_switch > self.auto_switch_interval and self.device_ids:
+            self.dev_mgr.current_index = (self.dev_mgr.current_index + 1) % len(self.device_ids)
+            self.switch_to_device(self.device_ids[self.dev_mgr.current_index])
+            self.dev_mgr.last_switch = time.time()
+        self.auto_switch_job = self.after(1000, self.auto_switch_task)
+
+    def switch_to_device(self, device_id):
+        # 只在查找设备时持有锁，重绘图表时不阻塞设备更新线程（update_charts取数据时自行加锁）
         with self.dev_mgr.device_lock:
-            target = next((d for d in self.dev_mgr.active_devices if d['ip'] == target_ip), None)
-            if target:
-                self.current_device = target
-                self.update_charts(target)
+            target = self.dev_mgr.devices.get(device_id)
+        if target:
+            self.current_device = target
+            self.update_charts(target)
 
     def update_charts(self, device):
         colors = {
@@ -393,20 +1010,54 @@ class ReceiverPro(tk.Tk):
         legend_font = font_manager.FontProperties(family=self.plot_font_family, size=9)
         label_font = font_manager.FontProperties(family=self.plot_font_family, size=8)
 
+        # 各指标取历史环形缓冲区的列视图；加锁保证取到的窗口与写入线程一致。
+        # 实时显示最近的原始样本，其他时间范围显示对应分级的平均值，CPU峰值取各时间桶的最大值
+        with self.dev_mgr.device_lock:
+            if self.time_range is None:
+                history = device['history']
+                times = history.window()[0]
+                cpu_history = history.column('cpu')
+                cpu_peak_history = history.column('cpu_peak')
+                mem_history = history.column('mem')
+                net_up_history = history.column('net_up')
+                net_down_history = history.column('net_down')
+            else:
+                since = time.time() - self.time_range
+                tier = device['archive'].select(self.time_range)
+                times, values = tier.window(since)
+                cpu_history = values[:, tier.index('cpu', 'avg')]
+                cpu_peak_history = values[:, tier.index('cpu_peak', 'max')]
+                mem_history = values[:, tier.index('mem', 'avg')]
+                net_up_history = values[:, tier.index('net_up', 'avg')]
+                net_down_history = values[:, tier.index('net_down', 'avg')]
+        # 横轴为本地时间
+        utc_offset = datetime.now().astimezone().utcoffset().total_seconds()
+        x = ((times + utc_offset) * 1000).astype('datetime64[ms]')
+
         self.ax_cpu.clear()
         self.ax_cpu.plot(
-            device['data']['cpu_history'],
+            x, cpu_history,
             color=colors['cpu'],
             linewidth=1.5,
             label='CPU利用率'
         )
+        if device.get('agg') or self.time_range is not None:
+            # 窗口聚合或降采样的记录：另画CPU峰值，短时尖峰不会被平均掉
+            self.ax_cpu.plot(
+                x, cpu_peak_history,
+                color=colors['cpu'],
+                linestyle=':',
+                linewidth=1.0,
+                alpha=0.7,
+                label='CPU峰值'
+            )
         self.ax_cpu.set_ylim(0, 100)
         self.ax_cpu.legend(loc='upper right', facecolor='#1a1a1a',
                            labelcolor='white', prop=legend_font)
 
         self.ax_mem.clear()
         self.ax_mem.plot(
-            device['data']['mem_history'],
+            x, mem_history,
             color=colors['mem'],
             linewidth=1.5,
             label='内存使用率'
@@ -417,14 +1068,14 @@ class ReceiverPro(tk.Tk):
 
         self.ax_network.clear()
         self.ax_network.plot(
-            device['data']['net_up_history'],
+            x, net_up_history,
             color=colors['net_up'],
             linestyle='-',
             linewidth=1.2,
             label='上传速度'
         )
         self.ax_network.plot(
-            device['data']['net_down_history'],
+            x, net_down_history,
             color=colors['net_down'],
             linestyle='--',
             linewidth=1.2,
@@ -434,8 +1085,8 @@ class ReceiverPro(tk.Tk):
                                labelcolor='white', prop=legend_font)
 
         # 设置网络流量轴的最大值，避免空数据时报错
-        up_max = max(device['data']['net_up_history']) if device['data']['net_up_history'] else 1
-        down_max = max(device['data']['net_down_history']) if device['data']['net_down_history'] else 1
+        up_max = net_up_history.max() if len(net_up_history) else 1
+        down_max = net_down_history.max() if len(net_down_history) else 1
         y_max = max(up_max, down_max, 1)
         self.ax_network.set_ylim(0, y_max * 1.1)
 
@@ -450,46 +1101,226 @@ class ReceiverPro(tk.Tk):
         self.chart_canvas.draw()
 
     def start_listener(self):
-        def listener():
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-                s.bind(('0.0.0.0', 12345))
-                s.listen(5)
-                print("监听服务已启动...")
-                while True:
-                    conn, addr = s.accept()
-                    threading.Thread(target=self.handle_connection, args=(conn,), daemon=True).start()
-
-        threading.Thread(target=listener, daemon=True).start()
-
-    def handle_connection(self, conn):
+        # 接收服务：所有连接由专用线程中的一个asyncio事件循环处理，不再为每个连接创建线程；
+        # 解析出的样本放入ingest_queue，由设备更新线程统一还原差量并写入设备管理器。
+        # 事件循环只做解析，不获取device_lock，界面重绘持有该锁时不会阻塞任何连接
+        self.listen_port = self.config.getint('Settings', 'listen_port', fallback=12345)
+        self.listen_backlog = self.config.getint('Settings', 'listen_backlog', fallback=1024)
+        # 单条消息（JSON行或帧）的大小上限，超过时关闭连接，避免异常数据占满内存
+        self.max_message_size = self.config.getint('Settings', 'max_message_size', fallback=16) * 1024 * 1024
+        self.max_connections = self.config.getint('Settings', 'max_connections', fallback=2000)
+        self.active_connections = 0
+        self.ingest_queue = queue.Queue(maxsize=self.config.getint('Settings', 'ingest_queue', fallback=100000))
+        self.ingest_dropped = 0
+        self.ingest_errors = 0
+
+        threading.Thread(target=self.apply_samples, name="ingest", daemon=True).start()
+        threading.Thread(target=lambda: asyncio.run(self.serve()), name="listener", daemon=True).start()
+
+    async def serve(self):
+        server = await asyncio.start_server(
+            self.handle_connection, '0.0.0.0', self.listen_port,
+            backlog=self.listen_backlog, reuse_address=True, limit=self.max_message_size
+        )
+        print("监听服务已启动...")
+        async with server:
+            await server.serve_forever()
+
+    def apply_samples(self):
+        # 设备更新线程：把接收服务解析出的样本依次写入设备管理器；
+        # 单个样本处理出错时只丢弃该样本并计数，线程继续处理后续样本
+        while True:
+            ip, name, data, frame_stats, options = self.ingest_queue.get()
+            try:
+                self.apply_sample(ip, name, data, frame_stats, options)
+            except Exception as e:
+                self.ingest_errors += 1
+                print(f"样本处理异常 ({name}@{ip}): {str(e)}")
+
+    def apply_sample(self, ip, name, data, frame_stats=None, options=None):
+        # 还原差量样本后写入设备管理器；data中样本字段以外的键是该样本的附加统计，
+        # frame_stats是帧级附加信息（如调度统计），只随该帧最后一个样本传入；
+        # options是帧级选项（FRAME_OPTIONS），随该帧的每个样本传入
+        options = options or {}
+        data = self.dev_mgr.expand_sample(EnhancedDeviceManager.device_id(ip, name), data)
+        if data is None:
+            return
+        stats = {k: v for k, v in data.items() if k not in SAMPLE_FIELDS}
+        stats.update(frame_stats or {})
+        sample_time = self.parse_sample_time(data.get('time'))
+        processed = {
+            'ip': ip,
+            'name': name,
+            'cpu': data.get('cpu', 0),
+            'mem': data.get('mem', 0),
+            'disk': data.get('disk', 0),
+            'net_up': data.get('net_up', 0),
+            'net_down': data.get('net_down', 0),
+            'sample_time': sample_time,
+            'net_rate': options.get('net_unit') == 'KB/s',
+            'stats': stats
+        }
+        time_text = data.get('time')
+        if isinstance(time_text, (int, float)):
+            time_text = datetime.fromtimestamp(time_text).isoformat()
+        if options.get('log_via_receiver'):
+            self.forward_log(name, time_text, round(processed['cpu'], 1), round(processed['mem'], 1))
+        self.dev_mgr.update_device(processed)
+
+    def submit_sample(self, ip, name, data, frame_stats=None, options=None):
+        # 解析出的样本交给设备更新线程，队列满时丢弃并计数，不阻塞事件循环
         try:
-            raw_data = conn.recv(4096)
-            if not raw_data:
+            self.ingest_queue.put_nowait((ip, name, data, frame_stats, options))
+        except queue.Full:
+            self.ingest_dropped += 1
+
+    async def handle_connection(self, reader, writer):
+        # 发送端使用长连接，一个连接上连续携带多条消息；按首字节判断该连接使用的协议。
+        # 连接数达到max_connections时直接关闭新连接，发送端会退避后重连
+        ip = (writer.get_extra_info('peername') or ('未知',))[0]
+        if self.active_connections >= self.max_connections:
+            print(f"连接数已达上限{self.max_connections}，拒绝连接 ({ip})")
+            writer.close()
+            return
+        self.active_connections += 1
+        try:
+            sock = writer.get_extra_info('socket')
+            if sock is not None:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            try:
+                head = await reader.readexactly(len(WIRE_MAGIC))
+            except asyncio.IncompleteReadError as e:
+                # 不足4个字节就关闭的连接只可能是旧版发送端的单条（不完整的）消息
+                if e.partial.strip():
+                    self.process_message(ip, e.partial)
                 return
+            if head == WIRE_MAGIC:
+                await self.handle_binary_stream(reader, ip)
+            elif head == FRAMED_JSON_MAGIC:
+                await self.handle_framed_json_stream(reader, ip)
+            elif head[:1] == WIRE_MAGIC[:1]:
+                print(f"数据解析错误: 无效的协议前导 ({ip})")
+            else:
+                await self.handle_json_stream(reader, ip, head)
+        except Exception as e:
+            print(f"连接处理异常: {str(e)}")
+        finally:
+            self.active_connections -= 1
+            writer.close()
+
+    async def handle_json_stream(self, reader, ip, head):
+        # 换行分隔的JSON消息，一个连接上可以连续携带任意多条；head为协商时已读取的开头几个字节。
+        # 旧版发送端每条消息单独连接且不带换行，连接关闭时按剩余数据解析
+        *messages, head = head.split(b'\n')
+        for raw_data in messages:
+            if raw_data.strip():
+                self.process_message(ip, raw_data)
+        while True:
+            try:
+                line = head + await reader.readuntil(b'\n')
+            except asyncio.IncompleteReadError as e:
+                if (head + e.partial).strip():
+                    self.process_message(ip, head + e.partial)
+                return
+            except asyncio.LimitOverrunError:
+                print(f"数据解析错误: 消息超过{self.max_message_size}字节 ({ip})")
+                return
+            head = b''
+            if line.strip():
+                self.process_message(ip, line)
 
-            device_data = json.loads(raw_data.decode())
-            ip = conn.getpeername()[0]
-
-            processed = {
-                'ip': ip,
-                'name': device_data.get('name', '未命名设备'),
-                'cpu': device_data.get('data', {}).get('cpu', 0),
-                'mem': device_data.get('data', {}).get('mem', 0),
-                'disk': device_data.get('data', {}).get('disk', 0),
-                'net_up': device_data.get('data', {}).get('net_up', 0),
-                'net_down': device_data.get('data', {}).get('net_down', 0)
-            }
+    async def handle_framed_json_stream(self, reader, ip):
+        # 长度前缀的JSON：消息内容不受换行限制，按长度一次读取完整消息
+        while True:
+            try:
+                length, = LENGTH_PREFIX.unpack(await reader.readexactly(LENGTH_PREFIX.size))
+                if length > self.max_message_size:
+                    print(f"数据解析错误: 消息超过{self.max_message_size}字节 ({ip})")
+                    return
+                self.process_message(ip, await reader.readexactly(length))
+            except asyncio.IncompleteReadError:
+                return
 
-            self.dev_mgr.update_device(processed)
+    async def handle_binary_stream(self, reader, ip):
+        # 二进制协议：连接前导之后循环读取帧头和帧体
+        name = '未命名设备'
+        pending_ext = None  # EXT帧携带的扩展字段，作用于紧随其后的SAMPLES帧
+        while True:
+            try:
+                msg_type, version, count, length = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+                if version > WIRE_VERSION:
+                    print(f"数据解析错误: 不支持的协议版本 {version} ({ip})")
+                    return
+                if length > self.max_message_size:
+                    print(f"数据解析错误: 消息超过{self.max_message_size}字节 ({ip})")
+                    return
+                body = await reader.readexactly(length)
+            except asyncio.IncompleteReadError:
+                return
 
-        except (json.JSONDecodeError, KeyError) as e:
+            if msg_type == MSG_HELLO:
+                name = body.decode('utf-8', errors='replace')
+            elif msg_type == MSG_EXT:
+                try:
+                    pending_ext = json.loads(body.decode())
+                except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                    print(f"数据解析错误: {str(e)}")
+                    pending_ext = None
+            elif msg_type == MSG_SAMPLES:
+                self.process_binary_samples(ip, name, body, count, pending_ext)
+                pending_ext = None
+
+    def process_binary_samples(self, ip, name, body, count, ext=None):
+        if len(body) != count * SAMPLE_STRUCT.size:
+            print(f"数据解析错误: 样本帧长度不匹配 ({ip})")
+            return
+        ext = ext or {}
+        extras = ext.get('samples') or []
+        frame_stats = dict(ext.get('frame') or {})
+        options = {k: frame_stats.pop(k) for k in FRAME_OPTIONS if k in frame_stats}
+        for index, (sample_time, cpu, mem, disk, net_up, net_down, gpu) in enumerate(SAMPLE_STRUCT.iter_unpack(body)):
+            data = dict(extras[index]) if index < len(extras) and isinstance(extras[index], dict) else {}
+            data.update(time=sample_time, cpu=cpu, mem=mem, disk=disk, net_up=net_up, net_down=net_down)
+            self.submit_sample(ip, name, data, frame_stats if index == count - 1 else None, options)
+
+    def process_message(self, ip, raw_data):
+        # 一帧可以是单个样本（data）或批量样本（samples），批量帧按顺序逐个展开
+        try:
+            device_data = json.loads(raw_data.decode())
+            name = device_data.get('name', '未命名设备')
+            samples = device_data.get('samples')
+            if samples is None:
+                samples = [device_data.get('data', {})]
+            # data/samples以外的键是帧级附加信息（如调度统计），随该帧最后一个样本记录
+            frame_stats = {k: v for k, v in device_data.items() if k not in ('name', 'data', 'samples')}
+            options = {k: frame_stats.pop(k) for k in FRAME_OPTIONS if k in frame_stats}
+            # 先检查整帧的数值字段，有非数值（如"abc"、null）时整帧按解析错误丢弃
+            for data in samples:
+                for key in NUMERIC_FIELDS:
+                    if key in data:
+                        data[key] = float(data[key])
+
+            for index, data in enumerate(samples):
+                self.submit_sample(ip, name, data, frame_stats if index == len(samples) - 1 else None, options)
+
+        except (json.JSONDecodeError, UnicodeDecodeError, KeyError, AttributeError, TypeError, ValueError) as e:
             print(f"数据解析错误: {str(e)}")
-        except Exception as e:
-            print(f"连接处理异常: {str(e)}")
-        finally:
-            conn.close()
 
+    def forward_log(self, name, sample_time, cpu, mem):
+        # 按发送端原有的日志格式生成一条记录，交给日志转发器
+        if self.log_forwarder is not None:
+            self.log_forwarder.send(f"[{sample_time}] {name} - CPU:{cpu}% MEM:{mem}%\n".encode())
+
+    @staticmethod
+    def parse_sample_time(value):
+        # 发送端的采集时间转换为Unix时间：二进制协议中已是Unix时间，JSON中为ISO时间戳；
+        # 缺失或格式错误时返回None
+        if isinstance(value, (int, float)):
+            return float(value)
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except (TypeError, ValueError):
+            return None
 
 if __name__ == "__main__":
     # 解决 macOS 特定的 TKinter 问题
@@ -10,6 +10,7 @@ import platform
 
 class ThreadedTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
     allow_reuse_address = True
+    daemon_threads = True  # 发送端使用长连接，退出时不等待连接线程结束
     address_family = socket.AF_INET6
     service_core = None
 
@@ -56,9 +57,12 @@ class LogServiceCore:
 
     class TCPHandler(socketserver.BaseRequestHandler):
         def handle(self):
+            # 长连接上逐行读取，每行一条日志
             try:
-                data = self.request.recv(1024).decode()
-                logging.info(f"[TCP]来自{self.client_address}的消息: {data.strip()}")
+                for line in self.request.makefile('rb'):
+                    data = line.decode(errors='replace').strip()
+                    if data:
+                        logging.info(f"[TCP]来自{self.client_address}的消息: {data}")
             except Exception as e:
                 logging.error(f"TCP处理错误: {str(e)}")
 